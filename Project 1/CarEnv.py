@@ -1,13 +1,12 @@
 import numpy as np
-import matplotlib.pyplot as plt
-from matplotlib.widgets import Button
 import random
+from collections import namedtuple
 
-# Enable interactive mode
-plt.ion()
+# Dense transition arrays indexed by [state, action], see CarEnv.get_transition_model
+TransitionModel = namedtuple('TransitionModel', ['next_state', 'reward', 'done', 'valid'])
 
 class CarEnv:
-    def __init__(self, x_limit, y_limit, start_position, start_orientation, target_position, target_orientation):
+    def __init__(self, x_limit, y_limit, start_position, start_orientation, target_position, target_orientation, headless=False):
         
         self.start_position = start_position
         self.start_orientation = start_orientation
@@ -23,23 +22,37 @@ class CarEnv:
         self.x_bounds = (-x_limit, x_limit)
         self.y_bounds = (-y_limit, y_limit)
         
+        self.target_reward = 10000
+        self.time_penalty = 1
+        
+        # Integer encoding of the MDP: state = (x, y, orientation) -> index, action = (steering, velocity) -> index
+        self.action_space = [(action, velocity) for action in self.actions for velocity in self.velocities]
+        self.nx = 2 * x_limit + 1
+        self.ny = 2 * y_limit + 1
+        self.nS = self.nx * self.ny * len(self.directions)
+        self.nA = len(self.action_space)
+        self._dynamics = None
+        self._predecessors = None
+        self._models = {}
+        
         self.movements = []  # [(x, y), orientation, velocity]
         self.steps = []
         self.current_index = 0
-        self.fig, self.ax = plt.subplots()
-
-        # Buttons
-        axprev = plt.axes([0.7, 0.02, 0.1, 0.075])
-        axnext = plt.axes([0.81, 0.02, 0.1, 0.075])
-        self.bnext = Button(axnext, 'Next')
-        self.bnext.on_clicked(self.next)
-        self.bprev = Button(axprev, 'Previous')
-        self.bprev.on_clicked(self.prev)
+        
+        # The matplotlib viewer is only created when something is plotted, headless envs never create it
+        self.headless = headless
+        self.renderer = None
+        self.recorder = None  # optional TrajectoryRecorder, records every logged step
 
-        # Change the window title (for TkAgg backend)
-        if plt.get_backend() == 'TkAgg':
-            manager = plt.get_current_fig_manager()
-            manager.window.title('Car Movement Visuals')  # Set the window title to 'CAR'
+    def get_config(self):
+        """
+        Constructor arguments, enough to rebuild an equivalent env (e.g. in a worker process).
+        """
+        return {
+            'x_limit': self.x_bounds[1], 'y_limit': self.y_bounds[1],
+            'start_position': tuple(self.start_position), 'start_orientation': self.start_orientation,
+            'target_position': tuple(self.target_position), 'target_orientation': self.target_orientation
+        }
 
     def step(self, action, velocity, log = False):
             
@@ -70,6 +83,10 @@ class CarEnv:
         
         done = self.check_done()
         reward = self.get_reward(done, steering, velocity)
+        
+        if(log and self.recorder is not None):
+            self.recorder.record((cur_step[0][0], cur_step[0][1], cur_step[1]), steering, velocity,
+                                 (self.x, self.y, self.orientation), reward, done)
         return (self.x, self.y, self.orientation), reward, done
     
     def update_orientation(self, steering):
@@ -105,127 +122,206 @@ class CarEnv:
     
     def get_reward(self, done, steering, velocity):
         if done:
-            return 10000  # Large reward for reaching target
+            return self.target_reward  # Large reward for reaching target
         else:
-            time = 1  # Small penalty for each time step
+            time = self.time_penalty  # Small penalty for each time step
             return -time
     
-    def arrow_buffer(self, velocity, dx, dy):
-        if(velocity <= 10):
-            return 0.8
-        if(velocity <= 20):
-            return 0.9
-        if(velocity <= 60):
-            return 0.95
-        return 0.975
+    def in_bounds(self, x, y):
+        return self.x_bounds[0] <= x <= self.x_bounds[1] and self.y_bounds[0] <= y <= self.y_bounds[1]
     
-    def update_plot(self):
-        # Check if the figure still exists, if not, create a new one
-        if not plt.fignum_exists(self.fig.number):
-            self.fig, self.ax = plt.subplots()
+    def state_index(self, state):
+        x, y, orientation = state
+        return ((x - self.x_bounds[0]) * self.ny + (y - self.y_bounds[0])) * len(self.directions) + self.directions.index(orientation)
+    
+    def index_state(self, s):
+        s, o = divmod(int(s), len(self.directions))
+        xi, yi = divmod(s, self.ny)
+        return (xi + self.x_bounds[0], yi + self.y_bounds[0], self.directions[o])
+    
+    def encode_states(self, xs, ys, orientation_ids):
+        """
+        Vectorized state_index for arrays of x, y and orientation indices (into self.directions).
+        """
+        xs = np.asarray(xs, dtype=np.int64) - self.x_bounds[0]
+        ys = np.asarray(ys, dtype=np.int64) - self.y_bounds[0]
+        return (xs * self.ny + ys) * len(self.directions) + np.asarray(orientation_ids, dtype=np.int64)
+    
+    def decode_states(self, idx):
+        """
+        Vectorized index_state, returns arrays (xs, ys, orientation_ids).
+        """
+        idx, orientation_ids = np.divmod(np.asarray(idx, dtype=np.int64), len(self.directions))
+        xi, yi = np.divmod(idx, self.ny)
+        return xi + self.x_bounds[0], yi + self.y_bounds[0], orientation_ids
+    
+    def target_index(self, target=None):
+        """
+        Index of the target state, or -1 if the target lies outside the grid.
+        """
+        if target is None:
+            target = (self.target_position[0], self.target_position[1], self.target_orientation)
+        if not self.in_bounds(target[0], target[1]):
+            return -1
+        return self.state_index(target)
+    
+    def get_dynamics(self):
+        """
+        Target independent part of the model: next_state[S, A] and valid[S, A].
+        
+        Built once with NumPy and cached. Moves that leave the grid are marked invalid
+        and their next_state points back to the state itself so it is always safe to index with.
+        """
+        if self._dynamics is None:
+            direction_map = {
+                'N': (0, 1), 'NE': (1, 1), 'E': (1, 0), 'SE': (1, -1),
+                'S': (0, -1), 'SW': (-1, -1), 'W': (-1, 0), 'NW': (-1, 1)
+            }
+            steering_map = {'straight': 0, 'right': 1, 'left': -1}
+            n_dir = len(self.directions)
+            dx = np.array([direction_map[d][0] for d in self.directions])
+            dy = np.array([direction_map[d][1] for d in self.directions])
+            turn = np.array([steering_map[a] for a, _ in self.action_space])
+            speed = np.array([v for _, v in self.action_space])
             
-            # Re-add buttons in the new figure
-            axprev = plt.axes([0.7, 0.02, 0.1, 0.075])
-            axnext = plt.axes([0.81, 0.02, 0.1, 0.075])
-            self.bnext = Button(axnext, 'Next')
-            self.bnext.on_clicked(self.next)
-            self.bprev = Button(axprev, 'Previous')
-            self.bprev.on_clicked(self.prev)
-
-            # Set window title for TkAgg backend
-            if plt.get_backend() == 'TkAgg':
-                manager = plt.get_current_fig_manager()
-                manager.window.title('Car Movement Visuals')  # Set the window title to 'CAR'
-                    
-        self.ax.clear()
-        self.ax.set_xlim(self.x_bounds)
-        self.ax.set_ylim(self.y_bounds)
-        self.ax.set_xlabel('X Position')
-        self.ax.set_ylabel('Y Position')
-        self.ax.set_title('Move #{}'.format(self.current_index + 1))
-        # self.ax.grid(True)
-        
-        start_pos, direction, velocity = self.movements[self.current_index]
-        direction_vectors = {
-            'N': (0, 1), 'NE': (1, 1), 'E': (1, 0), 'SE': (1, -1),
-            'S': (0, -1), 'SW': (-1, -1), 'W': (-1, 0), 'NW': (-1, 1)
-        }
-        dx, dy = direction_vectors[direction]
-        end_pos = (start_pos[0] + velocity * dx, start_pos[1] + velocity * dy)
-        
-        buff = self.arrow_buffer(velocity, dx, dy)
-        arr_buff = 1
-        if(velocity == 1):
-            arr_buff = 0.5
-        if(velocity == 2):
-            arr_buff = 0.75
-        if(velocity == 3):
-            arr_buff = 1
-        
-        self.ax.arrow(start_pos[0], start_pos[1], dx * velocity * buff, dy * velocity * buff,
-                      head_width=0.5*arr_buff, head_length=0.5*arr_buff, fc='black', ec='black')
-        
-        self.ax.scatter(start_pos[0], start_pos[1], color='blue', label='Previous Position')
-        self.ax.scatter(end_pos[0], end_pos[1], color='red', label='Current Position')
-        self.ax.scatter(self.target_position[0], self.target_position[1], color='green', label='Target')
-        self.ax.legend(loc='upper left', bbox_to_anchor=(1, 1))
-        
-        s = self.steps[self.current_index]
-        
-        console_text = """
-        Previous State:
-        Position: {} 
-        Orientation: {}
-        
-        Action:
-        Direction: {}
-        Velocity: {}
-        
-        Current State:
-        Position: {}
-        Orientation: {}
-        """.format(s[0], s[1], s[2], s[3], s[4], s[5])
-        
-        x_pos = 1.08  # X position to the right of the plot
-        y_pos = 0.75   # Y position within the plot area (adjust as needed)
-
-        # Add the text to the plot
-        self.ax.text(x_pos, y_pos, console_text, fontsize=10, verticalalignment='top',
-         bbox=dict(facecolor='lightgrey', alpha=0.5, edgecolor='black'), transform=self.ax.transAxes)
-
-        plt.tight_layout()
-        self.fig.canvas.draw()
-
-    def next(self, event):
-        if self.current_index < len(self.movements) - 1:
-            self.current_index += 1
-            self.update_plot()
-
-    def prev(self, event):
-        if self.current_index > 0:
-            self.current_index -= 1
-            self.update_plot()
+            idx = np.arange(self.nS)
+            xs, ys, os = self.decode_states(idx)
+            new_o = (os[:, None] + turn[None, :]) % n_dir
+            new_x = xs[:, None] + speed[None, :] * dx[new_o]
+            new_y = ys[:, None] + speed[None, :] * dy[new_o]
+            
+            valid = ((new_x >= self.x_bounds[0]) & (new_x <= self.x_bounds[1]) &
+                     (new_y >= self.y_bounds[0]) & (new_y <= self.y_bounds[1]))
+            next_state = np.where(valid, self.encode_states(new_x, new_y, new_o), idx[:, None])
+            self._dynamics = (next_state, valid)
+        return self._dynamics
+    
+    def get_transition_model(self, target=None):
+        """
+        Dense transition tables next_state[S, A], reward[S, A], done[S, A] and valid[S, A].
+        
+        States are encoded with state_index and actions index self.action_space. The tables
+        match step(): reward is target_reward when the move ends on the target and -time_penalty otherwise.
+        target defaults to the env target and can be any (x, y, orientation) to reuse the dynamics.
+        """
+        own_target = (self.target_position[0], self.target_position[1], self.target_orientation)
+        target = own_target if target is None else (target[0], target[1], target[2])
+        if target in self._models:
+            return self._models[target]
+        
+        next_state, valid = self.get_dynamics()
+        t = self.target_index(target)
+        done = valid & (next_state == t)
+        reward = np.where(done, self.target_reward, -self.time_penalty).astype(np.float64)
+        model = TransitionModel(next_state, reward, done, valid)
+        
+        # Only the env's own target is cached, batch solvers ask for many other targets
+        if target == own_target:
+            self._models[target] = model
+        return model
+    
+    def get_predecessors(self):
+        """
+        Reverse transition graph in CSR form: the states with a valid move into state s
+        are indices[indptr[s]:indptr[s + 1]]. Built once and cached.
+        """
+        if self._predecessors is None:
+            next_state, valid = self.get_dynamics()
+            sources = np.repeat(np.arange(self.nS), self.nA)[valid.ravel()]
+            targets = next_state.ravel()[valid.ravel()]
+            order = np.argsort(targets, kind='stable')
+            indptr = np.zeros(self.nS + 1, dtype=np.int64)
+            np.cumsum(np.bincount(targets, minlength=self.nS), out=indptr[1:])
+            self._predecessors = (indptr, sources[order])
+        return self._predecessors
+    
+    def target_distances(self, target=None):
+        """
+        Minimum number of moves from every state to the target (breadth-first search
+        backwards from the target), -1 for states that cannot reach it inside the bounds.
+        """
+        next_state, valid = self.get_dynamics()
+        distances = np.full(self.nS, -1, dtype=np.int64)
+        t = self.target_index(target)
+        if t < 0:
+            return distances
+        
+        distances[t] = 0
+        frontier = np.zeros(self.nS, dtype=bool)
+        frontier[t] = True
+        d = 0
+        while frontier.any():
+            d += 1
+            reached = (valid & frontier[next_state]).any(axis=1) & (distances < 0)
+            distances[reached] = d
+            frontier = reached
+        return distances
+    
+    def encode_policy(self, policy):
+        """
+        Converts a policy dict {(x, y, orientation): (steering, velocity) or None} to an action index array (-1 for None).
+        """
+        actions = np.full(self.nS, -1, dtype=np.int64)
+        action_ids = {a: i for i, a in enumerate(self.action_space)}
+        for state, action in policy.items():
+            if action is not None and self.in_bounds(state[0], state[1]):
+                actions[self.state_index(state)] = action_ids[tuple(action)]
+        return actions
+    
+    def decode_policy(self, actions):
+        return {self.index_state(s): (self.action_space[a] if a >= 0 else None) for s, a in enumerate(actions.tolist())}
+    
+    def encode_values(self, values):
+        V = np.zeros(self.nS)
+        for state, value in values.items():
+            if self.in_bounds(state[0], state[1]):
+                V[self.state_index(state)] = value
+        return V
+    
+    def decode_values(self, V):
+        return {self.index_state(s): v for s, v in enumerate(V.tolist())}
+    
+    def get_renderer(self):
+        """
+        The matplotlib viewer, created on first use. None for headless envs.
+        """
+        if self.headless:
+            return None
+        if self.renderer is None:
+            from CarRenderer import CarRenderer
+            self.renderer = CarRenderer(self)
+        return self.renderer
+    
+    def update_plot(self):
+        renderer = self.get_renderer()
+        if renderer is not None:
+            renderer.update_plot()
             
     def render(self):
-        # Disable interactive mode
-        plt.ioff()
-        plt.show()
-        plt.ion()
+        renderer = self.get_renderer()
+        if renderer is not None:
+            renderer.render()
         
     def reset(self):
         self.movements = []
         self.steps = []
         self.current_index = 0
+        if self.recorder is not None:
+            self.recorder.new_episode()
         
         self.x = self.start_position[0]
         self.y = self.start_position[1]
         self.orientation = self.start_orientation
         
     def off_interactive(self):
-        plt.ioff()
+        if not self.headless:
+            import matplotlib.pyplot as plt
+            plt.ioff()
         
     def on_interactive(self):
-        plt.ion()
+        if not self.headless:
+            import matplotlib.pyplot as plt
+            plt.ion()
         
 ## Testing the CarEnv class
 # env = CarEnv(5, 5, (0, 0), 'N', target_position=(10, 10), target_orientation='E')
@@ -0,0 +1,121 @@
+import matplotlib.pyplot as plt
+from matplotlib.widgets import Button
+
+# Enable interactive mode
+plt.ion()
+
+class CarRenderer:
+    """
+    Matplotlib replay viewer for a CarEnv: shows the logged moves one at a time with Next/Previous buttons.
+    Created by CarEnv on first use so that headless runs never import matplotlib.
+    """
+    def __init__(self, env):
+        self.env = env
+        self.create_figure()
+
+    def arrow_buffer(self, velocity, dx, dy):
+        if(velocity <= 10):
+            return 0.8
+        if(velocity <= 20):
+            return 0.9
+        if(velocity <= 60):
+            return 0.95
+        return 0.975
+    
+    def create_figure(self):
+        self.fig, self.ax = plt.subplots()
+        
+        # Buttons
+        axprev = plt.axes([0.7, 0.02, 0.1, 0.075])
+        axnext = plt.axes([0.81, 0.02, 0.1, 0.075])
+        self.bnext = Button(axnext, 'Next')
+        self.bnext.on_clicked(self.next)
+        self.bprev = Button(axprev, 'Previous')
+        self.bprev.on_clicked(self.prev)
+
+        # Change the window title (for TkAgg backend)
+        if plt.get_backend() == 'TkAgg':
+            manager = plt.get_current_fig_manager()
+            manager.window.title('Car Movement Visuals')  # Set the window title to 'CAR'
+    
+    def update_plot(self):
+        env = self.env
+        
+        # Check if the figure still exists, if not, create a new one
+        if not plt.fignum_exists(self.fig.number):
+            self.create_figure()
+                    
+        self.ax.clear()
+        self.ax.set_xlim(env.x_bounds)
+        self.ax.set_ylim(env.y_bounds)
+        self.ax.set_xlabel('X Position')
+        self.ax.set_ylabel('Y Position')
+        self.ax.set_title('Move #{}'.format(env.current_index + 1))
+        # self.ax.grid(True)
+        
+        start_pos, direction, velocity = env.movements[env.current_index]
+        direction_vectors = {
+            'N': (0, 1), 'NE': (1, 1), 'E': (1, 0), 'SE': (1, -1),
+            'S': (0, -1), 'SW': (-1, -1), 'W': (-1, 0), 'NW': (-1, 1)
+        }
+        dx, dy = direction_vectors[direction]
+        end_pos = (start_pos[0] + velocity * dx, start_pos[1] + velocity * dy)
+        
+        buff = self.arrow_buffer(velocity, dx, dy)
+        arr_buff = 1
+        if(velocity == 1):
+            arr_buff = 0.5
+        if(velocity == 2):
+            arr_buff = 0.75
+        if(velocity == 3):
+            arr_buff = 1
+        
+        self.ax.arrow(start_pos[0], start_pos[1], dx * velocity * buff, dy * velocity * buff,
+                      head_width=0.5*arr_buff, head_length=0.5*arr_buff, fc='black', ec='black')
+        
+        self.ax.scatter(start_pos[0], start_pos[1], color='blue', label='Previous Position')
+        self.ax.scatter(end_pos[0], end_pos[1], color='red', label='Current Position')
+        self.ax.scatter(env.target_position[0], env.target_position[1], color='green', label='Target')
+        self.ax.legend(loc='upper left', bbox_to_anchor=(1, 1))
+        
+        s = env.steps[env.current_index]
+        
+        console_text = """
+        Previous State:
+        Position: {} 
+        Orientation: {}
+        
+        Action:
+        Direction: {}
+        Velocity: {}
+        
+        Current State:
+        Position: {}
+        Orientation: {}
+        """.format(s[0], s[1], s[2], s[3], s[4], s[5])
+        
+        x_pos = 1.08  # X position to the right of the plot
+        y_pos = 0.75   # Y position within the plot area (adjust as needed)
+
+        # Add the text to the plot
+        self.ax.text(x_pos, y_pos, console_text, fontsize=10, verticalalignment='top',
+         bbox=dict(facecolor='lightgrey', alpha=0.5, edgecolor='black'), transform=self.ax.transAxes)
+
+        plt.tight_layout()
+        self.fig.canvas.draw()
+
+    def next(self, event):
+        if self.env.current_index < len(self.env.movements) - 1:
+            self.env.current_index += 1
+            self.update_plot()
+
+    def prev(self, event):
+        if self.env.current_index > 0:
+            self.env.current_index -= 1
+            self.update_plot()
+            
+    def render(self):
+        # Disable interactive mode
+        plt.ioff()
+        plt.show()
+        plt.ion()
@@ -2,6 +2,9 @@ import random
 import numpy as np
 import time
 import os
+from multiprocessing import Pool
+from workers import init_rollout_worker, rollout_worker, round_sizes
+from metrics import NULL_METRICS
 
 seed = time.time_ns() + os.getpid() + os.urandom(16).__hash__()
 random.seed(seed)
@@ -12,7 +15,11 @@ class MonteCarloLearning:
         self.gamma = gamma
         self.policy = {}
         self.value_table = {}
-        self.returns = {}
+        self.returns_count = {}
+        self.returns_sum = {}
+        self.greedy = False  # True once every state has been improved at least once
+        self.verbose = True  # print every episode, costly for long runs
+        self.metrics = NULL_METRICS  # metrics.Metrics() to time the phases and count steps/episodes
         self.initialize_policy()
 
     def initialize_policy(self):
@@ -28,7 +35,8 @@ class MonteCarloLearning:
                 for orientation in self.env.directions:
                     self.policy[(x, y, orientation)] = (random.choice(self.env.actions), random.choice(self.env.velocities))
                     self.value_table[(x, y, orientation)] = 0
-                    self.returns[(x, y, orientation)] = []
+                    self.returns_count[(x, y, orientation)] = 0
+                    self.returns_sum[(x, y, orientation)] = 0
                     
                     if(self.policy[(x, y, orientation)][0] == 'left'):
                         left += 1
@@ -56,6 +64,7 @@ class MonteCarloLearning:
         
         episode = []
         visited_states = set()
+        ending = 'episodes_target'
         
         self.env.reset()
         self.env.x, self.env.y, self.env.orientation = state
@@ -66,6 +75,7 @@ class MonteCarloLearning:
             state = (self.env.x, self.env.y, self.env.orientation)
             
             if state not in self.policy or self.policy[state] is None:
+                ending = 'episodes_no_action'
                 break
             
             # Epsilon-greedy action selection
@@ -77,21 +87,31 @@ class MonteCarloLearning:
             next_state, reward, done = self.env.step(*action)
             
             if not self.is_valid_state(next_state):
+                ending = 'episodes_out_of_bounds'
                 break
             
             if next_state in visited_states:
+                ending = 'episodes_loop'
                 break
             
             visited_states.add(next_state)
             episode.append((state, action, reward))
             state = next_state  # Update state to the new state
         
-        for sar in episode:
-            print("\t", sar)
+        if self.metrics.enabled:
+            self.metrics.count(ending)
+            # The move that ended an aborted episode was simulated but not recorded
+            self.metrics.count('steps', len(episode) + (ending in ('episodes_out_of_bounds', 'episodes_loop')))
+        
+        if self.verbose:
+            for sar in episode:
+                print("\t", sar)
         
         return episode
 
     def update_value_function(self, episode):
+        # Returns the states whose value changed
+        changed = set()
         G = 0
         visited = {}
         for i in range(len(episode) - 1, -1, -1):
@@ -102,11 +122,32 @@ class MonteCarloLearning:
             state, action, reward = episode[i]
             G = self.gamma * G + reward
             if visited[state] == i:
-                self.returns[state].append(G)
-                self.value_table[state] = np.mean(self.returns[state])
+                self.returns_count[state] += 1
+                self.returns_sum[state] += G
+                value = self.returns_sum[state] / self.returns_count[state]
+                if value != self.value_table[state]:
+                    changed.add(state)
+                self.value_table[state] = value
+        return changed
+
+    def affected_states(self, changed):
+        """
+        States whose greedy action can change when the values of the changed states do:
+        their predecessors in the transition graph (CarEnv.get_predecessors).
+        """
+        indptr, predecessors = self.env.get_predecessors()
+        affected = set()
+        for state in changed:
+            s = self.env.state_index(state)
+            affected.update(self.env.index_state(p) for p in predecessors[indptr[s]:indptr[s + 1]].tolist())
+        return affected
 
-    def improve_policy(self):
-        for state in self.value_table.keys():
+    def improve_policy(self, states=None):
+        # states=None re-improves every state, otherwise only the given ones
+        if states is None:
+            states = self.value_table.keys()
+            self.greedy = True
+        for state in states:
             best_action = None
             best_value = float('-inf')
             for action in self.env.actions:
@@ -124,7 +165,7 @@ class MonteCarloLearning:
                             
             self.policy[state] = best_action
 
-    def run_monte_carlo(self, episodes=100):
+    def run_monte_carlo(self, episodes=100, incremental=False):
         ct = 0
         
         start_time = time.time()
@@ -134,25 +175,82 @@ class MonteCarloLearning:
                 break
             
             itr = 1
-            episode = self.generate_episode()
-            while(episode is None):
+            with self.metrics.phase('generate_episode'):
                 episode = self.generate_episode()
-                itr += 1
-                
-                if(itr == 100):
-                    break
+                while(episode is None):
+                    episode = self.generate_episode()
+                    itr += 1
+                    
+                    if(itr == 100):
+                        break
                 
             if(episode is None):
                 continue
                 
-            self.update_value_function(episode)
-            self.improve_policy()
+            with self.metrics.phase('update_value_function'):
+                changed = self.update_value_function(episode)
+            with self.metrics.phase('improve_policy'):
+                if incremental and self.greedy:
+                    # Same result as a full improve_policy, only the predecessors of changed states can differ
+                    self.improve_policy(self.affected_states(changed))
+                else:
+                    self.improve_policy()
             ct += 1
+            self.metrics.count('episodes')
+            self.metrics.count('backups', len(episode))
             
-            print("Episode: ", ct)
+            if self.verbose:
+                print("Episode: ", ct)
             start_time = time.time()
             
         print("Total valid episodes: ", ct)
 
+    def merge_returns(self, state_actions, return_sums, counts):
+        """
+        Merges (state_action, return_sum, count) aggregates from the rollout workers (workers.rollout_worker) into the value table.
+        """
+        states, inverse = np.unique(state_actions // self.env.nA, return_inverse=True)
+        return_sums = np.bincount(inverse, weights=return_sums)
+        counts = np.bincount(inverse, weights=counts)
+        changed = set()
+        for s, return_sum, count in zip(states.tolist(), return_sums.tolist(), counts.tolist()):
+            state = self.env.index_state(s)
+            self.returns_count[state] += int(count)
+            self.returns_sum[state] += return_sum
+            value = self.returns_sum[state] / self.returns_count[state]
+            if value != self.value_table[state]:
+                changed.add(state)
+            self.value_table[state] = value
+        return changed
+
+    def run_monte_carlo_parallel(self, episodes=100, workers=None, batch_size=100, epsilon=0.5, incremental=False):
+        """
+        run_monte_carlo with a pool of rollout workers (see MCC.MonteCarloControl.run_monte_carlo_parallel).
+        Every round the workers play batch_size episodes each with a snapshot of the policy,
+        the returns are merged and the policy is improved once.
+        """
+        workers = workers or os.cpu_count()
+        ct = 0
+        with Pool(workers, initializer=init_rollout_worker, initargs=(self.env.get_config(), random.getrandbits(64))) as pool:
+            while(ct < episodes):
+                policy = self.env.encode_policy(self.policy).astype(np.int8)
+                sizes = round_sizes(episodes - ct, batch_size, workers)
+                changed = set()
+                with self.metrics.phase('rollouts'):
+                    aggregates = pool.starmap(rollout_worker, [(policy, n, epsilon, self.gamma) for n in sizes])
+                with self.metrics.phase('merge_returns'):
+                    for aggregate in aggregates:
+                        changed |= self.merge_returns(*aggregate)
+                        self.metrics.count('backups', int(aggregate[2].sum()))
+                
+                with self.metrics.phase('improve_policy'):
+                    self.improve_policy(self.affected_states(changed) if incremental and self.greedy else None)
+                ct += sum(sizes)
+                self.metrics.count('episodes', sum(sizes))
+                if self.verbose:
+                    print("Episode: ", ct)
+            
+        print("Total valid episodes: ", ct)
+
     def get_policy(self):
         return self.policy
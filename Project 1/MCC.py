@@ -2,33 +2,134 @@ import random
 import numpy as np
 import time
 import os
-import plotting
+import weakref
+from multiprocessing import Pool
+from multiprocessing.shared_memory import SharedMemory
+from checkpoints import checkpoint_titles
+from metrics import NULL_METRICS
+from warmstart import q_from_values
+from workers import rollout_episodes, episode_returns, init_rollout_worker, rollout_worker, worker, round_sizes
 
 seed = time.time_ns() + os.getpid() + os.urandom(16).__hash__()
 random.seed(seed)
 
+def merge_returns(Q, returns_count, returns_sum, state_actions, return_sums, counts, alpha=None):
+    """
+    Merges (state_action, return_sum, count) aggregates into flat Q / count / sum arrays.
+    With a constant alpha the mean return of the aggregate is used as a single target.
+    """
+    returns_count[state_actions] += counts
+    returns_sum[state_actions] += return_sums
+    if alpha is None:
+        Q[state_actions] = returns_sum[state_actions] / returns_count[state_actions]
+    else:
+        Q[state_actions] += alpha * (return_sums / counts - Q[state_actions])
+
+def _release_shared(shm):
+    # Unlink first, closing fails while numpy views of the block are still alive
+    try:
+        shm.unlink()
+    except FileNotFoundError:
+        pass
+    try:
+        shm.close()
+    except BufferError:
+        pass
+
+class SharedTables:
+    """
+    Q, returns_count and returns_sum [nS, nA] tables in one multiprocessing.shared_memory block.
+    Created by the learner, attached by name (zero-copy) in worker processes.
+    The creator unlinks the block in close(unlink=True), or when it is garbage collected or at exit.
+    """
+    def __init__(self, shape, name=None):
+        size = int(np.prod(shape))
+        if name is None:
+            self.shm = SharedMemory(create=True, size=3 * size * 8)
+            self._finalizer = weakref.finalize(self, _release_shared, self.shm)
+        else:
+            self.shm = SharedMemory(name=name)
+            self._finalizer = None
+        self.shape = shape
+        self.Q = np.ndarray(shape, dtype=np.float64, buffer=self.shm.buf)
+        self.returns_count = np.ndarray(shape, dtype=np.int64, buffer=self.shm.buf, offset=size * 8)
+        self.returns_sum = np.ndarray(shape, dtype=np.float64, buffer=self.shm.buf, offset=2 * size * 8)
+        if name is None:
+            self.Q[:] = 0
+            self.returns_count[:] = 0
+            self.returns_sum[:] = 0
+
+    def close(self, unlink=False):
+        self.Q = self.returns_count = self.returns_sum = None
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+            if self._finalizer is not None:
+                self._finalizer.detach()
+
+class GreedyPolicy:
+    """
+    Greedy action lookup straight from a (possibly shared) Q table, always reads the current values.
+    """
+    def __init__(self, Q):
+        self.Q = Q
+
+    def __getitem__(self, states):
+        return self.Q[states].argmax(axis=-1)
+
+def _init_shared_worker(config, seed, name, shape):
+    init_rollout_worker(config, seed)
+    worker['tables'] = SharedTables(shape, name)
+
+def _shared_rollout_worker(n, epsilon, gamma, alpha):
+    # Hogwild: read the greedy policy from and write the returns into the shared tables without locking
+    tables = worker['tables']
+    aggregate = rollout_worker(GreedyPolicy(tables.Q), n, epsilon, gamma)
+    merge_returns(tables.Q.reshape(-1), tables.returns_count.reshape(-1), tables.returns_sum.reshape(-1), *aggregate, alpha)
+    return n
+
+def _shared_rollout_worker_star(job):
+    return _shared_rollout_worker(*job)
+
 class MonteCarloControl:
-    def __init__(self, env, gamma=0.9, epsilon=0.1):
+    def __init__(self, env, gamma=0.9, epsilon=0.1, alpha=None, shared=False):
         self.env = env
         self.gamma = gamma
         self.epsilon = epsilon
-        self.Q = {}  # Action-value function
-        self.returns = {}  # Store returns for each state-action pair
+        self.alpha = alpha  # None: sample average of returns, float: constant step-size
+        self.shared = shared  # keep the tables in shared memory for run_monte_carlo_shared
+        self.plotter = None  # optional checkpoints.CheckpointPlotter, renders checkpoints in the background
+        self.checkpoint_every = None  # extra checkpoints every so many episodes
+        self.metrics = NULL_METRICS  # metrics.Metrics() to time the phases and count steps/episodes
+        self.Q = None  # Action-value function Q[state_index, action_index]
+        self.action_ids = {action: i for i, action in enumerate(env.action_space)}
         self.initialize_Q()
         self.start_states = set()
+        self.rng = np.random.default_rng(random.getrandbits(64))
 
     def initialize_Q(self):
-        x_lim = self.env.x_bounds[1]
-        y_lim = self.env.y_bounds[1]
+        if self.shared:
+            self.tables = SharedTables((self.env.nS, self.env.nA))
+            self.Q, self.returns_count, self.returns_sum = self.tables.Q, self.tables.returns_count, self.tables.returns_sum
+            return
+        
+        # States are encoded with env.state_index and actions index env.action_space
+        self.Q = np.zeros((self.env.nS, self.env.nA))
         
-        for x in range(-x_lim, x_lim + 1):
-            for y in range(-y_lim, y_lim + 1):
-                for orientation in self.env.directions:
-                    for action in self.env.actions:
-                        for velocity in self.env.velocities:
-                            state_action = ((x, y, orientation), (action, velocity))
-                            self.Q[state_action] = 0
-                            self.returns[state_action] = []
+        # Running count and sum of returns per [state, action], enough for the sample average
+        self.returns_count = np.zeros((self.env.nS, self.env.nA), dtype=np.int64)
+        self.returns_sum = np.zeros((self.env.nS, self.env.nA))
+
+    def warm_start(self, values, weight=0):
+        """
+        Seeds Q with a one-step lookahead on a value array (warmstart.q_from_values), so the greedy
+        policy starts out as the transferred one. With weight > 0 the seed also counts as weight
+        returns in the sample averages, otherwise the first real return of a pair replaces it.
+        """
+        self.Q[:] = q_from_values(self.env, np.asarray(values, dtype=np.float64), self.gamma)
+        if weight:
+            self.returns_count[:] = weight
+            self.returns_sum[:] = weight * self.Q
 
     def is_valid_state(self, state):
         x, y, orientation = state
@@ -43,7 +144,7 @@ class MonteCarloControl:
             print(f"State: {state}")
             for action in self.env.actions:
                 for velocity in self.env.velocities:
-                    q_value = self.Q.get((state, (action, velocity)), 0)
+                    q_value = self.Q[self.env.state_index(state), self.action_ids[(action, velocity)]]
                     print(f"  Action: {action}, Velocity: {velocity}, Q-Value: {q_value}")
 
     def generate_episode(self):
@@ -57,6 +158,8 @@ class MonteCarloControl:
         
         episode = []
         visited_states = set()
+        metrics = self.metrics
+        ending = 'episodes_target'
         
         self.env.reset()
         self.env.x, self.env.y, self.env.orientation = state
@@ -68,73 +171,210 @@ class MonteCarloControl:
             
             if random.random() < self.epsilon:
                 action = (random.choice(self.env.actions), random.choice(self.env.velocities))
+            elif metrics.enabled:
+                with metrics.phase('get_best_action'):
+                    action = self.get_best_action(state)
             else:
                 action = self.get_best_action(state)
             
             next_state, reward, done = self.env.step(*action)
             
             if not self.is_valid_state(next_state):
+                ending = 'episodes_out_of_bounds'
                 break
             
             if next_state in visited_states:
+                ending = 'episodes_loop'
                 break
             
             visited_states.add(next_state)
             episode.append((state, action, reward))
             state = next_state
         
+        if metrics.enabled:
+            metrics.count(ending)
+            # The move that ended an aborted episode was simulated but not recorded
+            metrics.count('steps', len(episode) + (ending != 'episodes_target'))
         return episode
 
     def get_best_action(self, state):
-        best_action = None
-        best_value = float('-inf')
-        for action in self.env.actions:
-            for velocity in self.env.velocities:
-                state_action = (state, (action, velocity))
-                if self.Q[state_action] > best_value:
-                    best_value = self.Q[state_action]
-                    best_action = (action, velocity)
-        return best_action
+        # argmax keeps the first maximum, same tie-breaking as scanning env.action_space in order
+        return self.env.action_space[self.Q[self.env.state_index(state)].argmax()]
 
     def update_Q(self, episode):
         G = 0
         visited = set()
         for state, action, reward in reversed(episode):
             G = self.gamma * G + reward
-            state_action = (state, action)
+            state_action = (self.env.state_index(state), self.action_ids[action])
             if state_action not in visited:
-                self.returns[state_action].append(G)
-                self.Q[state_action] = np.mean(self.returns[state_action])
+                self.returns_count[state_action] += 1
+                if self.alpha is None:
+                    self.returns_sum[state_action] += G
+                    self.Q[state_action] = self.returns_sum[state_action] / self.returns_count[state_action]
+                else:
+                    self.Q[state_action] += self.alpha * (G - self.Q[state_action])
                 visited.add(state_action)
 
-    def run_monte_carlo(self, episodes=1000):
-        self.states = {(x, y, orientation) for x in range(-self.env.x_bounds[1], self.env.x_bounds[1] + 1)
-                       for y in range(-self.env.y_bounds[1], self.env.y_bounds[1] + 1)
-                       for orientation in self.env.directions}
+    def plot_checkpoint(self, title):
+        with self.metrics.phase('plot_checkpoint'):
+            if self.plotter is not None:
+                self.plotter.submit(self.Q.max(axis=1), title)
+                return
+            # Headless envs never import matplotlib
+            if self.env.headless:
+                return
+            import plotting
+            self.env.off_interactive()
+            plotting.plot_value_function(self.Q.max(axis=1), title, 1, self.env)
+            self.env.on_interactive()
+
+    def generate_episodes(self, n):
+        """
+        Batched generate_episode: n episodes from the current greedy policy, see rollout_episodes.
+        """
+        starts = []
+        while self.start_states and len(starts) < n:
+            starts.append(self.env.state_index(self.start_states.pop()))
+        starts = np.concatenate([np.array(starts, dtype=np.int64), self.rng.integers(self.env.nS, size=n - len(starts))])
+        
+        return rollout_episodes(self.env.get_transition_model(), self.Q.argmax(axis=1), starts, self.epsilon, self.rng, self.metrics)
+
+    def update_Q_batch(self, states, actions, rewards, lengths):
+        """
+        update_Q for a batch of episodes from generate_episodes.
+        
+        Episodes never revisit a state, so every step is a first visit. With a constant alpha,
+        pairs visited by several episodes of the same batch all step from the same old Q value.
+        """
+        returns = episode_returns(rewards, lengths, self.gamma)
+        mask = np.arange(rewards.shape[1])[None, :] < lengths[:, None]
+        state_actions = states[mask] * self.env.nA + actions[mask]
+        returns = returns[mask]
+        
+        count, total, Q = self.returns_count.reshape(-1), self.returns_sum.reshape(-1), self.Q.reshape(-1)
+        count += np.bincount(state_actions, minlength=len(count))
+        if self.alpha is None:
+            total += np.bincount(state_actions, weights=returns, minlength=len(total))
+            Q[state_actions] = total[state_actions] / count[state_actions]
+        else:
+            np.add.at(Q, state_actions, self.alpha * (returns - Q[state_actions]))
+
+    def run_monte_carlo(self, episodes=1000, batch_size=None):
+        if batch_size is not None:
+            return self.run_monte_carlo_batched(episodes, batch_size)
+        
+        metrics = self.metrics
         for i in range(episodes):
-            episode = self.generate_episode()
-            self.update_Q(episode)
+            with metrics.phase('generate_episode'):
+                episode = self.generate_episode()
+            with metrics.phase('update_Q'):
+                self.update_Q(episode)
+            metrics.count('episodes')
+            metrics.count('backups', len(episode))
             # print("Generated episode with length:", len(episode))
             
-            if(i == 1):
-                self.env.off_interactive()
-                plotting.plot_value_function(self.get_q_values(), "Initial Q-Values of MCC", 1)
-                self.env.on_interactive()
+            for title in checkpoint_titles("Q-Values of MCC", i, 1, episodes, self.checkpoint_every):
+                self.plot_checkpoint(title)
+
+    def run_monte_carlo_batched(self, episodes=1000, batch_size=10000):
+        done = 0
+        while done < episodes:
+            n = min(batch_size, episodes - done)
+            with self.metrics.phase('generate_episodes'):
+                batch = self.generate_episodes(n)
+            with self.metrics.phase('update_Q_batch'):
+                self.update_Q_batch(*batch)
+            self.metrics.count('episodes', n)
+            self.metrics.count('backups', int(batch[3].sum()))
+            
+            for title in checkpoint_titles("Q-Values of MCC", done, n, episodes, self.checkpoint_every):
+                self.plot_checkpoint(title)
+            
+            done += n
+
+    def merge_returns(self, state_actions, return_sums, counts):
+        """
+        Merges (state_action, return_sum, count) aggregates from rollout workers into Q.
+        """
+        merge_returns(self.Q.reshape(-1), self.returns_count.reshape(-1), self.returns_sum.reshape(-1),
+                      state_actions, return_sums, counts, self.alpha)
+
+    def run_monte_carlo_parallel(self, episodes=100000, workers=None, batch_size=2000):
+        """
+        Monte Carlo control with a pool of rollout workers.
+        
+        Each worker owns a seeded CarEnv and runs batches of batch_size episodes with a snapshot of the
+        current greedy policy. It sends back only (state_action, return_sum, count) aggregates, the learner
+        merges them into Q and hands out a fresh snapshot with the next round of batches.
+        """
+        workers = workers or os.cpu_count()
+        done = 0
+        with Pool(workers, initializer=init_rollout_worker, initargs=(self.env.get_config(), random.getrandbits(64))) as pool:
+            while done < episodes:
+                policy = self.Q.argmax(axis=1).astype(np.int8)
+                sizes = round_sizes(episodes - done, batch_size, workers)
+                jobs = [(policy, n, self.epsilon, self.gamma) for n in sizes]
+                with self.metrics.phase('rollouts'):
+                    aggregates = pool.starmap(rollout_worker, jobs)
+                with self.metrics.phase('merge_returns'):
+                    for aggregate in aggregates:
+                        self.merge_returns(*aggregate)
+                        self.metrics.count('backups', int(aggregate[2].sum()))
                 
-            if(i == episodes//2):
-                self.env.off_interactive()
-                plotting.plot_value_function(self.get_q_values(), "Half-way Q-Values of MCC", 1)
-                self.env.on_interactive()
+                n = sum(sizes)
+                self.metrics.count('episodes', n)
+                for title in checkpoint_titles("Q-Values of MCC", done, n, episodes, self.checkpoint_every):
+                    self.plot_checkpoint(title)
+                
+                done += n
+
+    def run_monte_carlo_shared(self, episodes=100000, workers=None, batch_size=2000):
+        """
+        Lock-free parallel Monte Carlo control on the shared memory tables (needs shared=True).
+        
+        Workers attach to the Q table by name, pick greedy actions from it zero-copy and apply
+        their returns to it directly (Hogwild style, concurrent updates of the same pair can be lost),
+        so there is no policy snapshot to send and nothing to merge in the learner.
+        """
+        if not self.shared:
+            raise ValueError("run_monte_carlo_shared needs MonteCarloControl(..., shared=True)")
+        
+        workers = workers or os.cpu_count()
+        sizes = [min(batch_size, episodes - i) for i in range(0, episodes, batch_size)]
+        initargs = (self.env.get_config(), random.getrandbits(64), self.tables.shm.name, self.Q.shape)
+        done = 0
+        with Pool(workers, initializer=_init_shared_worker, initargs=initargs) as pool:
+            jobs = [(n, self.epsilon, self.gamma, self.alpha) for n in sizes]
+            # Batches are handled as they finish, so checkpoints see Q while the workers keep training
+            finished = pool.imap_unordered(_shared_rollout_worker_star, jobs)
+            for _ in jobs:
+                with self.metrics.phase('rollouts'):
+                    n = next(finished)
+                self.metrics.count('episodes', n)
+                for title in checkpoint_titles("Q-Values of MCC", done, n, episodes, self.checkpoint_every):
+                    self.plot_checkpoint(title)
+                
+                done += n
+
+    def close(self):
+        """
+        Releases the shared memory tables, Q is copied back into private memory first.
+        Use the learner as a context manager to release them even when training fails.
+        """
+        if self.shared:
+            self.Q, self.returns_count, self.returns_sum = self.Q.copy(), self.returns_count.copy(), self.returns_sum.copy()
+            self.tables.close(unlink=True)
+            self.shared = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
 
     def get_policy(self):
-        policy = {}
-        for state in set(sa[0] for sa in self.Q.keys()):
-            policy[state] = self.get_best_action(state)
-        return policy
+        return self.env.decode_policy(self.Q.argmax(axis=1))
     
     def get_q_values(self):
-        q_values = {}
-        for state in set(sa[0] for sa in self.Q.keys()):
-            best_action = self.get_best_action(state)
-            q_values[state] = self.Q[(state, best_action)]
-        return q_values
\ No newline at end of file
+        return self.env.decode_values(self.Q.max(axis=1))
\ No newline at end of file
@@ -1,5 +1,24 @@
 import random
-import plotting
+import numpy as np
+from checkpoints import checkpoint_titles
+from metrics import NULL_METRICS
+
+def greedy_backup(model, V, gamma, states=None):
+    """
+    One greedy Bellman backup over all states (or the given state indices) of a CarEnv transition model.
+    
+    Returns (best_values, best_actions). Invalid moves are never chosen, ties go to the
+    first action in env.action_space and states without a valid move get action -1.
+    """
+    if states is None:
+        next_state, reward, valid = model.next_state, model.reward, model.valid
+    else:
+        next_state, reward, valid = model.next_state[states], model.reward[states], model.valid[states]
+    Q = np.where(valid, reward + gamma * V[next_state], -np.inf)
+    best_actions = Q.argmax(axis=1)
+    best_values = Q[np.arange(len(Q)), best_actions]
+    best_actions[~valid.any(axis=1)] = -1
+    return best_values, best_actions
 
 class PolicyIteration:
     def __init__(self, env, gamma=0.9):
@@ -7,6 +26,9 @@ class PolicyIteration:
         self.gamma = gamma
         self.policy = {}
         self.value_table = {}
+        self.plotter = None  # optional checkpoints.CheckpointPlotter, renders checkpoints in the background
+        self.checkpoint_every = None  # extra checkpoints every so many iterations
+        self.metrics = NULL_METRICS  # metrics.Metrics() to time the phases and count backups
         self.initialize_policy()
 
     def initialize_policy(self):
@@ -49,10 +71,13 @@ class PolicyIteration:
                 continue
                     
             new_value_table[state] = reward + self.gamma * self.value_table[next_state]
-            
+        
+        delta = max(abs(new_value_table[state] - self.value_table[state]) for state in new_value_table)
         self.value_table = new_value_table
+        return delta
         
     def policy_improvement(self):
+        changed = 0
         for state in self.value_table.keys():
             x, y, orientation = state
             best_action = None
@@ -70,27 +95,143 @@ class PolicyIteration:
                         if value > best_value:
                             best_value = value
                             best_action = (action, velocity)
-                            
+            
+            if best_action != self.policy[state]:
+                changed += 1
             self.policy[state] = best_action
+        return changed
 
     def run_policy_iteration(self, iterations=100):
         for i in range(iterations):
             print("Policy Iteration: ", i)
-            self.policy_evaluation()
-            self.policy_improvement()
+            with self.metrics.phase('policy_evaluation'):
+                self.policy_evaluation()
+            with self.metrics.phase('policy_improvement'):
+                self.policy_improvement()
+            self.metrics.count('iterations')
+            self.metrics.count('backups', self.env.nS * (1 + self.env.nA))
             
-            if(i == 1):
-                self.env.off_interactive()
-                plotting.plot_value_function(self.value_table, "Initial Value Tablue of PI", 1)
-                self.env.on_interactive()
-                
-            if(i == iterations//2):
-                self.env.off_interactive()
-                plotting.plot_value_function(self.value_table, "Half-way Value Tablue of PI", 1)
-                self.env.on_interactive()
+            for title in checkpoint_titles("Value Tablue of PI", i, 1, iterations, self.checkpoint_every):
+                self.plot_checkpoint(title)
+
+    def plot_checkpoint(self, title):
+        with self.metrics.phase('plot_checkpoint'):
+            if self.plotter is not None:
+                self.plotter.submit(self.get_value_array(), title)
+                return
+            # Headless envs never import matplotlib
+            if self.env.headless:
+                return
+            import plotting
+            self.env.off_interactive()
+            plotting.plot_value_function(self.get_value_array(), title, 1, self.env)
+            self.env.on_interactive()
+
+    def evaluate_policy(self, theta=1e-3, max_sweeps=1000):
+        """
+        Repeats evaluation sweeps until the max-norm change drops below theta.
+        Returns (sweeps, residual).
+        """
+        residual = float('inf')
+        sweeps = 0
+        while sweeps < max_sweeps and residual >= theta:
+            residual = self.policy_evaluation()
+            sweeps += 1
+        return sweeps, residual
+
+    def run_until_converged(self, theta=1e-3, max_iterations=100, max_evaluation_sweeps=1000):
+        """
+        Policy iteration with full evaluation (to tolerance theta) and a stable-policy stop:
+        finishes as soon as an improvement pass changes no action.
+        """
+        self.stats = {'iterations': 0, 'evaluation_sweeps': 0, 'residual': None, 'changed': [], 'converged': False}
+        for i in range(max_iterations):
+            with self.metrics.phase('policy_evaluation'):
+                sweeps, residual = self.evaluate_policy(theta, max_evaluation_sweeps)
+            with self.metrics.phase('policy_improvement'):
+                changed = self.policy_improvement()
+            self.metrics.count('iterations')
+            self.metrics.count('backups', self.env.nS * (sweeps + self.env.nA))
+            
+            self.stats['iterations'] = i + 1
+            self.stats['evaluation_sweeps'] += sweeps
+            self.stats['residual'] = float(residual)
+            self.stats['changed'].append(int(changed))
+            print("Policy Iteration: ", i, " sweeps: ", sweeps, " residual: ", residual, " changed actions: ", changed)
+            
+            if changed == 0:
+                self.stats['converged'] = True
+                break
+        
+        print("Stopped after ", self.stats['iterations'], " iterations, residual: ", self.stats['residual'])
+        return self.stats
+
+    def warm_start(self, values, actions):
+        """
+        Seeds the value table and policy from arrays over the env states, e.g. from warmstart.transfer.
+        States without a transferred action keep their initial random action.
+        """
+        self.value_table = self.env.decode_values(values)
+        for state, action in self.env.decode_policy(actions).items():
+            if action is not None:
+                self.policy[state] = action
 
     def get_policy(self):
         return self.policy
     
     def get_value_table(self):
         return self.value_table
+
+    def get_value_array(self):
+        return self.env.encode_values(self.value_table)
+
+class VectorizedPolicyIteration(PolicyIteration):
+    """
+    Same algorithm as PolicyIteration but backed by the CarEnv transition model:
+    values and policy are arrays over integer states, so each evaluation sweep and
+    each improvement pass is a single NumPy gather/argmax.
+    """
+    def __init__(self, env, gamma=0.9):
+        self.model = env.get_transition_model()
+        self.target = env.target_index()
+        super().__init__(env, gamma)
+    
+    def initialize_policy(self):
+        super().initialize_policy()
+        self.pi = self.env.encode_policy(self.policy)
+        self.V = np.zeros(self.env.nS)
+    
+    def policy_evaluation(self):
+        states = np.arange(self.env.nS)
+        has_action = self.pi >= 0
+        actions = np.where(has_action, self.pi, 0)
+        
+        next_states = self.model.next_state[states, actions]
+        valid = has_action & self.model.valid[states, actions]
+        
+        new_V = np.where(valid, self.model.reward[states, actions] + self.gamma * self.V[next_states], self.V)
+        if self.target >= 0:
+            new_V[self.target] = 0
+        
+        delta = np.abs(new_V - self.V).max()
+        self.V = new_V
+        return delta
+    
+    def policy_improvement(self):
+        _, new_pi = greedy_backup(self.model, self.V, self.gamma)
+        changed = np.count_nonzero(new_pi != self.pi)
+        self.pi = new_pi
+        return changed
+    
+    def get_policy(self):
+        return self.env.decode_policy(self.pi)
+    
+    def warm_start(self, values, actions):
+        self.V = np.array(values, dtype=np.float64)
+        self.pi = np.where(np.asarray(actions) >= 0, actions, self.pi).astype(self.pi.dtype)
+
+    def get_value_table(self):
+        return self.env.decode_values(self.V)
+
+    def get_value_array(self):
+        return self.V
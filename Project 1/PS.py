@@ -0,0 +1,79 @@
+import heapq
+import numpy as np
+from PI import greedy_backup
+
+class PrioritizedSweeping:
+    """
+    Prioritized sweeping planner for CarEnv.
+    
+    Values start at the return of never reaching the target (-time_penalty / (1 - gamma))
+    which is already a fixed point for every state that does not lead into the target or a
+    dead end, so only those few states start with a Bellman error. From there values are
+    propagated backwards over the reverse transition graph, always backing up the state
+    with the largest Bellman error first. Work scales with the number of states whose value
+    actually changes instead of (2*grid+1)^2*8 backups per sweep. States are popped in
+    batches of batch_size so each round of backups is a single NumPy call.
+    """
+    def __init__(self, env, gamma=0.9, theta=1e-3, batch_size=512):
+        self.env = env
+        self.gamma = gamma
+        self.theta = theta
+        self.batch_size = batch_size
+        self.model = env.get_transition_model()
+        self.target = env.target_index()
+        self.indptr, self.predecessors = env.get_predecessors()
+        
+        self.has_action = self.model.valid.any(axis=1)
+        if self.target >= 0:
+            self.has_action[self.target] = False
+        self.V = np.where(self.has_action, -env.time_penalty / (1 - gamma), 0.0)
+
+    def bellman_errors(self, states):
+        best_values, _ = greedy_backup(self.model, self.V, self.gamma, states)
+        return best_values, np.abs(best_values - self.V[states])
+
+    def run(self, max_updates=None):
+        priority = np.zeros(self.env.nS)
+        heap = []
+        
+        def push(states, errors):
+            keep = errors > np.maximum(priority[states], self.theta)
+            for s, e in zip(states[keep].tolist(), errors[keep].tolist()):
+                priority[s] = e
+                heapq.heappush(heap, (-e, s))
+        
+        # Seed the queue with every state whose initial Bellman error is above theta
+        states = np.flatnonzero(self.has_action)
+        push(states, self.bellman_errors(states)[1])
+        
+        updates = 0
+        while heap and (max_updates is None or updates < max_updates):
+            # Pop up to batch_size of the highest priority states and back them up together
+            batch = []
+            while heap and len(batch) < self.batch_size:
+                e, s = heapq.heappop(heap)
+                if -e != priority[s]:
+                    continue  # stale entry, s was pushed again with a higher priority
+                priority[s] = 0
+                batch.append(s)
+            if not batch:
+                break
+            
+            batch = np.array(batch)
+            self.V[batch] = self.bellman_errors(batch)[0]
+            updates += len(batch)
+            
+            preds = np.unique(np.concatenate([self.predecessors[self.indptr[s]:self.indptr[s + 1]] for s in batch]))
+            preds = preds[self.has_action[preds]]
+            if len(preds):
+                push(preds, self.bellman_errors(preds)[1])
+        
+        self.stats = {'updates': updates, 'converged': not heap}
+        return self.stats
+
+    def get_policy(self):
+        _, best_actions = greedy_backup(self.model, self.V, self.gamma)
+        return self.env.decode_policy(best_actions)
+
+    def get_value_table(self):
+        return self.env.decode_values(self.V)
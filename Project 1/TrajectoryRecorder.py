@@ -0,0 +1,153 @@
+import numpy as np
+
+# One row per move, orientations index CarEnv.directions and steering indexes CarEnv.actions
+STEP_DTYPE = np.dtype([
+    ('episode', np.int64), ('step', np.int32),
+    ('x', np.int32), ('y', np.int32), ('orientation', np.int8),
+    ('steering', np.int8), ('velocity', np.uint8),
+    ('next_x', np.int32), ('next_y', np.int32), ('next_orientation', np.int8),
+    ('reward', np.float32), ('done', np.bool_),
+])
+
+class TrajectoryRecorder:
+    """
+    Records car moves into a preallocated structured NumPy ring buffer.
+    
+    Memory stays at capacity rows no matter how many steps are recorded, once the buffer
+    is full the oldest steps are overwritten. Attach it with env.recorder = recorder to record
+    every logged env.step, or feed whole batches from workers.rollout_episodes with record_rollout.
+    """
+    def __init__(self, capacity=1000000, directions=None, actions=None):
+        self.buffer = np.zeros(capacity, dtype=STEP_DTYPE)
+        self.capacity = capacity
+        self.directions = directions or ['N', 'NE', 'E', 'SE', 'S', 'SW', 'W', 'NW']
+        self.actions = actions or ['straight', 'right', 'left']
+        self.head = 0  # next row to write
+        self.size = 0
+        self.total = 0  # steps recorded so far, including overwritten ones
+        self.episode = 0
+        self.step = 0
+
+    def new_episode(self):
+        if self.step:
+            self.episode += 1
+            self.step = 0
+
+    def record(self, state, steering, velocity, next_state, reward, done):
+        row = self.buffer[self.head]
+        row['episode'], row['step'] = self.episode, self.step
+        row['x'], row['y'], row['orientation'] = state[0], state[1], self.directions.index(state[2])
+        row['steering'], row['velocity'] = self.actions.index(steering), velocity
+        row['next_x'], row['next_y'], row['next_orientation'] = next_state[0], next_state[1], self.directions.index(next_state[2])
+        row['reward'], row['done'] = reward, done
+        self.step += 1
+        self._advance(1)
+
+    def record_rollout(self, env, states, actions, rewards, lengths):
+        """
+        Bulk-records a batch from workers.rollout_episodes, every row of the batch is a new episode.
+        """
+        mask = np.arange(states.shape[1])[None, :] < lengths[:, None]
+        episode_ids, steps = np.nonzero(mask)
+        s, a = states[mask], actions[mask]
+        model = env.get_transition_model()
+        next_s = model.next_state[s, a]
+        
+        rows = np.zeros(len(s), dtype=STEP_DTYPE)
+        rows['episode'] = self.episode + (1 if self.step else 0) + episode_ids
+        rows['step'] = steps
+        rows['x'], rows['y'], rows['orientation'] = env.decode_states(s)
+        rows['next_x'], rows['next_y'], rows['next_orientation'] = env.decode_states(next_s)
+        rows['steering'] = a // len(env.velocities)
+        rows['velocity'] = np.array(env.velocities)[a % len(env.velocities)]
+        rows['reward'] = rewards[mask]
+        rows['done'] = model.done[s, a]
+        
+        self.episode = rows['episode'][-1] + 1 if len(rows) else self.episode
+        self.step = 0
+        self.extend(rows)
+
+    def extend(self, rows):
+        recorded = len(rows)
+        # Only the last capacity rows can survive
+        rows = rows[-self.capacity:]
+        first = min(len(rows), self.capacity - self.head)
+        self.buffer[self.head:self.head + first] = rows[:first]
+        self.buffer[:len(rows) - first] = rows[first:]
+        self._advance(len(rows), recorded)
+
+    def _advance(self, n, recorded=None):
+        # n rows written, recorded steps (more when a bulk record overflowed the buffer)
+        self.head = (self.head + n) % self.capacity
+        self.size = min(self.size + n, self.capacity)
+        self.total += n if recorded is None else recorded
+
+    def get_steps(self):
+        """
+        Recorded steps in chronological order (a copy).
+        """
+        if self.size < self.capacity:
+            return self.buffer[:self.size].copy()
+        return np.concatenate([self.buffer[self.head:], self.buffer[:self.head]])
+
+    def get_episode(self, episode):
+        steps = self.get_steps()
+        return steps[steps['episode'] == episode]
+
+    def dump(self, filename):
+        """
+        Writes all buffered steps to a .npy file in one go.
+        """
+        np.save(filename, self.get_steps())
+
+    @staticmethod
+    def load(filename):
+        return np.load(filename)
+
+    def export_animation(self, filename, env, episodes=None, fps=5, steps=None):
+        """
+        Renders recorded moves into a GIF (Pillow) or MP4 (ffmpeg) in one pass with the Agg backend,
+        no window and no per-move redraw of the whole axes. episodes limits it to some episode ids.
+        """
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib import animation
+        
+        if steps is None:
+            steps = self.get_steps()
+        if episodes is not None:
+            steps = steps[np.isin(steps['episode'], episodes)]
+        if len(steps) == 0:
+            raise ValueError("No recorded steps to animate")
+        
+        fig = Figure(figsize=(6, 6))
+        FigureCanvasAgg(fig)
+        ax = fig.add_subplot(111)
+        ax.set_xlim(env.x_bounds)
+        ax.set_ylim(env.y_bounds)
+        ax.set_xlabel('X Position')
+        ax.set_ylabel('Y Position')
+        ax.scatter(env.target_position[0], env.target_position[1], color='green', label='Target')
+        path, = ax.plot([], [], color='grey', linewidth=1)
+        previous = ax.scatter([], [], color='blue', label='Previous Position')
+        current = ax.scatter([], [], color='red', label='Current Position')
+        ax.legend(loc='upper left')
+        title = ax.set_title('')
+        
+        episode_start = np.r_[0, np.flatnonzero(np.diff(steps['episode'])) + 1]
+        start_of = np.repeat(episode_start, np.diff(np.r_[episode_start, len(steps)]))
+        
+        def draw(i):
+            s = steps[i]
+            xs = np.r_[steps['x'][start_of[i]:i + 1], s['next_x']]
+            ys = np.r_[steps['y'][start_of[i]:i + 1], s['next_y']]
+            path.set_data(xs, ys)
+            previous.set_offsets([[s['x'], s['y']]])
+            current.set_offsets([[s['next_x'], s['next_y']]])
+            title.set_text('Episode {} move #{}: {} {} -> {}'.format(
+                s['episode'], s['step'] + 1, self.actions[s['steering']], s['velocity'], self.directions[s['next_orientation']]))
+            return path, previous, current, title
+        
+        anim = animation.FuncAnimation(fig, draw, frames=len(steps), blit=False)
+        writer = animation.FFMpegWriter(fps=fps) if filename.endswith('.mp4') else animation.PillowWriter(fps=fps)
+        anim.save(filename, writer=writer)
@@ -0,0 +1,93 @@
+import numpy as np
+from PI import greedy_backup
+
+class ValueIteration:
+    """
+    Value Iteration for CarEnv on top of the integer transition model.
+    
+    in_place=False does synchronous (Jacobi) sweeps from a copy of the value table.
+    in_place=True does asynchronous (Gauss-Seidel) sweeps: states are backed up block by block
+    in sweep order and every block already sees the values written by the previous ones.
+    sweep_order is None (state index order, one x column per block), 'backward' (breadth-first
+    layers outwards from the target, so the target reward travels across the grid in one sweep)
+    or an explicit array of state indices.
+    target defaults to the env target, any other (x, y, orientation) reuses the env dynamics.
+    """
+    def __init__(self, env, gamma=0.9, in_place=False, sweep_order=None, block_size=None, target=None):
+        self.env = env
+        self.gamma = gamma
+        self.in_place = in_place
+        self.target_state = target
+        self.model = env.get_transition_model(target)
+        self.target = env.target_index(target)
+        self.has_action = self.model.valid.any(axis=1)
+        self.V = np.zeros(env.nS)
+        self.blocks = self.build_blocks(sweep_order, block_size)
+
+    def build_blocks(self, sweep_order, block_size):
+        if block_size is None:
+            block_size = self.env.ny * len(self.env.directions)
+        
+        if isinstance(sweep_order, str) and sweep_order == 'backward':
+            distances = self.env.target_distances(self.target_state)
+            order = np.argsort(np.where(distances < 0, np.iinfo(np.int64).max, distances), kind='stable')
+            bounds = np.flatnonzero(np.diff(distances[order])) + 1
+            return np.split(order, bounds)
+        
+        if sweep_order is None:
+            order = np.arange(self.env.nS)
+        else:
+            order = np.asarray(sweep_order, dtype=np.int64)
+        return [order[i:i + block_size] for i in range(0, len(order), block_size)]
+
+    def sweep(self):
+        """
+        One value iteration sweep, returns the max-norm change.
+        """
+        if not self.in_place:
+            best_values, _ = greedy_backup(self.model, self.V, self.gamma)
+            new_V = np.where(self.has_action, best_values, self.V)
+            if self.target >= 0:
+                new_V[self.target] = 0
+            delta = np.abs(new_V - self.V).max()
+            self.V = new_V
+            return delta
+        
+        delta = 0
+        for states in self.blocks:
+            states = states[self.has_action[states] & (states != self.target)]
+            if len(states) == 0:
+                continue
+            best_values, _ = greedy_backup(self.model, self.V, self.gamma, states)
+            delta = max(delta, np.abs(best_values - self.V[states]).max())
+            self.V[states] = best_values
+        return delta
+
+    def run_value_iteration(self, theta=1e-3, max_sweeps=1000, verbose=True):
+        self.stats = {'sweeps': 0, 'residual': None, 'converged': False}
+        for i in range(max_sweeps):
+            delta = self.sweep()
+            self.stats['sweeps'] = i + 1
+            self.stats['residual'] = float(delta)
+            if verbose:
+                print("Value Iteration: ", i, " residual: ", delta)
+            
+            if delta < theta:
+                self.stats['converged'] = True
+                break
+        return self.stats
+
+    def warm_start(self, values):
+        """
+        Starts from a value array over the env states instead of zeros, e.g. from warmstart.transfer.
+        """
+        self.V = np.array(values, dtype=np.float64)
+        if self.target >= 0:
+            self.V[self.target] = 0
+
+    def get_policy(self):
+        _, best_actions = greedy_backup(self.model, self.V, self.gamma)
+        return self.env.decode_policy(best_actions)
+
+    def get_value_table(self):
+        return self.env.decode_values(self.V)
@@ -0,0 +1,55 @@
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+from CarEnv import CarEnv
+import storage
+from PI import greedy_backup
+from VI import ValueIteration
+
+def solve_chunk(env, targets, gamma=0.9, theta=1e-3, max_sweeps=1000):
+    """
+    Solves several targets on the same env, sharing its target independent dynamics.
+    
+    Each target only needs its own reward table and a backward in-place value iteration
+    (a couple of sweeps), the transition table itself is built once.
+    Returns (values[T, S], actions[T, S]) with the same conventions as VI.ValueIteration.
+    """
+    values = np.zeros((len(targets), env.nS))
+    actions = np.full((len(targets), env.nS), -1, dtype=np.int64)
+    for i, target in enumerate(targets):
+        vi = ValueIteration(env, gamma, in_place=True, sweep_order='backward', target=target)
+        vi.run_value_iteration(theta, max_sweeps, verbose=False)
+        values[i] = vi.V
+        actions[i] = greedy_backup(vi.model, vi.V, gamma)[1]
+    return values, actions
+
+def _solve_chunk_worker(config, targets, gamma, theta, max_sweeps):
+    return solve_chunk(CarEnv(**config, headless=True), targets, gamma, theta, max_sweeps)
+
+def solve_targets(env, targets, gamma=0.9, theta=1e-3, max_sweeps=1000, chunk_size=16, workers=1):
+    """
+    Solves a list of (x, y, orientation) targets on env's grid.
+    
+    With workers > 1 the targets are split into chunks of chunk_size and spread over a
+    process pool, every worker builds the transition table once for all of its chunks.
+    Returns (values[T, S], actions[T, S]).
+    """
+    targets = [tuple(t) for t in targets]
+    if workers <= 1:
+        return solve_chunk(env, targets, gamma, theta, max_sweeps)
+    
+    chunks = [targets[i:i + chunk_size] for i in range(0, len(targets), chunk_size)]
+    config = env.get_config()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(_solve_chunk_worker, [config] * len(chunks), chunks,
+                                [gamma] * len(chunks), [theta] * len(chunks), [max_sweeps] * len(chunks)))
+    
+    values = np.concatenate([r[0] for r in results])
+    actions = np.concatenate([r[1] for r in results])
+    return values, actions
+
+def save_targets(filename, env, targets, values, actions):
+    """
+    Writes all solved targets to one memory-mapped policy store (storage.PolicyStore).
+    """
+    storage.save_store(filename, env, targets, actions, values)
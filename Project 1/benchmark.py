@@ -0,0 +1,240 @@
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import time
+from queue import Empty
+import numpy as np
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+SOLVERS = ['pi', 'mcc', 'mc', 'lib_dp', 'lib_mc']
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+def make_env(grid, target):
+    from CarEnv import CarEnv
+    return CarEnv(grid, grid, (0, 0), 'N', (target[0], target[1]), target[2], headless=True)
+
+def bench_pi(grid, target, args):
+    from PI import VectorizedPolicyIteration
+    env = make_env(grid, target)
+    start = time.perf_counter()
+    pi = VectorizedPolicyIteration(env, args.gamma)
+    stats = pi.run_until_converged(args.theta)
+    wall = time.perf_counter() - start
+    # One state backup per state per evaluation sweep, nA per state per improvement
+    updates = env.nS * (stats['evaluation_sweeps'] + stats['iterations'] * env.nA)
+    return {'wall': wall, 'states': env.nS, 'states_per_sec': updates / wall,
+            'iterations': stats['iterations'], 'evaluation_sweeps': stats['evaluation_sweeps']}
+
+def bench_mcc(grid, target, args):
+    from MCC import MonteCarloControl
+    env = make_env(grid, target)
+    start = time.perf_counter()
+    mcc = MonteCarloControl(env, args.gamma)
+    mcc.run_monte_carlo(args.episodes, batch_size=args.batch_size)
+    wall = time.perf_counter() - start
+    return {'wall': wall, 'states': env.nS, 'episodes': args.episodes, 'episodes_per_sec': args.episodes / wall}
+
+def bench_mc(grid, target, args):
+    from MC import MonteCarloLearning
+    env = make_env(grid, target)
+    start = time.perf_counter()
+    mc = MonteCarloLearning(env, args.gamma)
+    mc.run_monte_carlo(args.mc_episodes, incremental=True)
+    wall = time.perf_counter() - start
+    return {'wall': wall, 'states': env.nS, 'episodes': args.mc_episodes, 'episodes_per_sec': args.mc_episodes / wall}
+
+def bench_lib_dp(grid, target, args):
+    # Iterative policy evaluation of the uniform random policy, as in DP/Policy Evaluation
+    from lib.envs.gridworld import GridworldEnv
+    env = GridworldEnv(shape=[grid, grid])
+    start = time.perf_counter()
+    policy = np.ones([env.nS, env.nA]) / env.nA
+    V = np.zeros(env.nS)
+    sweeps = 0
+    while True:
+        delta = 0
+        for s in range(env.nS):
+            v = 0
+            for a, action_prob in enumerate(policy[s]):
+                for prob, next_state, reward, done in env.P[s][a]:
+                    v += action_prob * prob * (reward + args.gamma * V[next_state])
+            delta = max(delta, np.abs(v - V[s]))
+            V[s] = v
+        sweeps += 1
+        if delta < args.theta:
+            break
+    wall = time.perf_counter() - start
+    return {'wall': wall, 'states': env.nS, 'states_per_sec': env.nS * sweeps / wall, 'evaluation_sweeps': sweeps}
+
+def bench_lib_mc(grid, target, args):
+    # First-visit MC prediction on Blackjack, as in MC/MC Prediction, the grid does not apply
+    from lib.envs.blackjack import BlackjackEnv
+    env = BlackjackEnv()
+    start = time.perf_counter()
+    returns_sum, returns_count = {}, {}
+    for _ in range(args.episodes):
+        episode = []
+        state = env.reset()
+        done = False
+        while not done:
+            action = 0 if state[0] >= 20 else 1
+            next_state, reward, done, _ = env.step(action)
+            episode.append((state, reward))
+            state = next_state
+        G = 0
+        for state, reward in reversed(episode):
+            G = args.gamma * G + reward
+            returns_sum[state] = returns_sum.get(state, 0) + G
+            returns_count[state] = returns_count.get(state, 0) + 1
+    wall = time.perf_counter() - start
+    return {'wall': wall, 'states': len(returns_count), 'episodes': args.episodes, 'episodes_per_sec': args.episodes / wall}
+
+BENCHMARKS = {'pi': bench_pi, 'mcc': bench_mcc, 'mc': bench_mc, 'lib_dp': bench_lib_dp, 'lib_mc': bench_lib_mc}
+
+def run_case(solver, grid, target, args, queue):
+    """
+    Runs one benchmark in a fresh process so peak RSS belongs to that case alone.
+    """
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    sys.path.insert(0, os.getcwd())
+    try:
+        # The solvers report progress with print, keep it out of the report
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = BENCHMARKS[solver](grid, target, args)
+        result['peak_rss_mb'] = peak_rss_mb()
+    except ImportError as e:
+        result = {'skipped': str(e)}
+    except Exception as e:
+        result = {'error': repr(e)}
+    queue.put(result)
+
+def measure(solver, grid, target, args):
+    """
+    Result dict of one case, {'error': ...} if the case process crashed or ran past args.timeout.
+    """
+    context = multiprocessing.get_context('spawn')
+    queue = context.Queue()
+    process = context.Process(target=run_case, args=(solver, grid, target, args, queue))
+    process.start()
+    deadline = time.time() + args.timeout
+    result = None
+    while result is None:
+        try:
+            result = queue.get(timeout=1)
+        except Empty:
+            # A child that died without reporting (e.g. killed, out of memory) never puts a result
+            if not process.is_alive():
+                result = {'error': 'case process exited with code {}'.format(process.exitcode)}
+            elif time.time() > deadline:
+                process.terminate()
+                result = {'error': 'timed out after {} s'.format(args.timeout)}
+    process.join()
+    return result
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def parse_target(text):
+    x, y, orientation = text.split(',')
+    return (int(x), int(y), orientation)
+
+def compare(results, baseline_file, tolerance):
+    """
+    Prints the cases that got slower than the baseline report by more than tolerance.
+    """
+    with open(baseline_file) as f:
+        baseline = {(r['solver'], r['grid'], tuple(r['target'])): r for r in json.load(f)['results']}
+
+    regressions = 0
+    for r in results:
+        old = baseline.get((r['solver'], r['grid'], tuple(r['target'])))
+        if old is None or 'wall' not in old or 'wall' not in r:
+            continue
+        ratio = r['wall'] / old['wall']
+        if ratio > 1 + tolerance:
+            regressions += 1
+            print("Regression: ", r['solver'], " grid ", r['grid'], " target ", tuple(r['target']), " {:.2f}x slower".format(ratio))
+    print("Regressions: ", regressions)
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Times the planners and learners across grid sizes and targets.")
+    parser.add_argument('--solvers', nargs='+', default=SOLVERS, choices=SOLVERS)
+    parser.add_argument('--grids', nargs='+', type=int, default=[10, 25, 50, 100])
+    parser.add_argument('--targets', nargs='+', type=parse_target, default=[(3, 5, 'NE')], help="x,y,orientation")
+    parser.add_argument('--gamma', type=float, default=0.9)
+    parser.add_argument('--theta', type=float, default=1e-3)
+    parser.add_argument('--episodes', type=int, default=20000, help="episodes for mcc and lib_mc")
+    parser.add_argument('--batch-size', type=int, default=5000, help="mcc episodes per batch")
+    parser.add_argument('--mc-episodes', type=int, default=20, help="episodes for the dict based mc")
+    parser.add_argument('--timeout', type=float, default=3600, help="seconds before a case is abandoned")
+    parser.add_argument('--output', default='benchmark.json')
+    parser.add_argument('--baseline', help="earlier report to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="allowed slowdown against the baseline")
+    args = parser.parse_args()
+
+    results = []
+    print(f"{'Solver':<10}{'Grid':<8}{'Target':<18}{'Wall (s)':<12}{'Peak RSS (MB)':<16}{'States/s':<14}{'Episodes/s'}")
+    for solver in args.solvers:
+        # The lib envs ignore the target, run them once per grid
+        targets = args.targets if solver in ('pi', 'mcc', 'mc') else args.targets[:1]
+        grids = args.grids if solver != 'lib_mc' else args.grids[:1]
+        for grid in grids:
+            for target in targets:
+                result = measure(solver, grid, target, args)
+                result.update({'solver': solver, 'grid': grid, 'target': list(target)})
+                results.append(result)
+
+                if 'skipped' in result:
+                    print(f"{solver:<10}{grid:<8}{str(target):<18}skipped: {result['skipped']}")
+                    continue
+                if 'error' in result:
+                    print(f"{solver:<10}{grid:<8}{str(target):<18}error: {result['error']}")
+                    continue
+                rss = '-' if result['peak_rss_mb'] is None else '{:.1f}'.format(result['peak_rss_mb'])
+                states = '{:.0f}'.format(result['states_per_sec']) if 'states_per_sec' in result else '-'
+                episodes = '{:.0f}'.format(result['episodes_per_sec']) if 'episodes_per_sec' in result else '-'
+                print(f"{solver:<10}{grid:<8}{str(target):<18}{result['wall']:<12.3f}{rss:<16}{states:<14}{episodes}")
+
+    report = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'config': {k: v for k, v in vars(args).items() if k not in ('output', 'baseline')},
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print("\nReport saved to: ", args.output)
+
+    # Failed cases and regressions both fail the run
+    failed = sum('error' in r for r in results)
+    if args.baseline:
+        failed += compare(results, args.baseline, args.tolerance)
+    sys.exit(1 if failed else 0)
+
+if __name__ == '__main__':
+    main()
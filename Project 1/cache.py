@@ -0,0 +1,162 @@
+import hashlib
+import json
+import os
+import time
+from contextlib import contextmanager
+
+import storage
+
+try:
+    import fcntl
+except ImportError:  # Windows, the manifest is then not protected against concurrent writers
+    fcntl = None
+
+# Bump when a change to the dynamics or the solvers makes older results wrong
+CACHE_VERSION = 1
+
+def solve_key(env, solver, **params):
+    """
+    Content address of a solve: sha256 over everything that changes the result, the grid, target,
+    dynamics (directions, actions, velocities), rewards, the solver name and its parameters.
+    The start state is left out, the solvers cover every state whatever it is.
+    """
+    config = env.get_config()
+    spec = {
+        'cache_version': CACHE_VERSION,
+        'format': storage.MAGIC.decode(),
+        'env': {
+            'x_limit': config['x_limit'], 'y_limit': config['y_limit'],
+            'target_position': list(config['target_position']), 'target_orientation': config['target_orientation'],
+            'directions': env.directions, 'actions': env.actions, 'velocities': env.velocities,
+            'target_reward': env.target_reward, 'time_penalty': env.time_penalty,
+        },
+        'solver': solver,
+        'params': params,
+    }
+    return hashlib.sha256(json.dumps(spec, sort_keys=True).encode()).hexdigest(), spec
+
+def _file_digest(filename):
+    h = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+class SolveCache:
+    """
+    Content-addressed cache of solver results (storage artifacts) on disk.
+
+    Entries are named by solve_key and listed in manifest.json with their size, sha256 and last use.
+    get checks the size and checksum before handing out an artifact, a damaged entry is dropped and
+    reported as a miss. put evicts the least recently used entries once the cache exceeds max_bytes.
+    """
+    def __init__(self, directory='./cache', max_bytes=1 << 30):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.manifest_file = os.path.join(directory, 'manifest.json')
+        os.makedirs(directory, exist_ok=True)
+
+    @contextmanager
+    def _locked(self):
+        # Several CLI workers may share the cache directory
+        with open(os.path.join(self.directory, '.lock'), 'w') as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _read_manifest(self):
+        try:
+            with open(self.manifest_file) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_manifest(self, manifest):
+        tmp = self.manifest_file + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(manifest, f, indent=1)
+        os.replace(tmp, self.manifest_file)
+
+    def path(self, key):
+        return os.path.join(self.directory, key + '.bin')
+
+    def _remove(self, manifest, key):
+        manifest.pop(key, None)
+        try:
+            os.remove(self.path(key))
+        except OSError:
+            pass
+
+    def get(self, key):
+        """
+        The storage.PolicyArtifact cached under key, None on a miss or a damaged entry.
+        """
+        with self._locked():
+            manifest = self._read_manifest()
+            entry = manifest.get(key)
+            if entry is None:
+                return None
+
+            filename = self.path(key)
+            try:
+                valid = os.path.getsize(filename) == entry['size'] and _file_digest(filename) == entry['sha256']
+                artifact = storage.PolicyArtifact(filename) if valid else None
+            except (OSError, ValueError):
+                artifact = None
+
+            if artifact is None:
+                print("Dropping damaged cache entry: ", key)
+                self._remove(manifest, key)
+            else:
+                entry['last_used'] = time.time()
+            self._write_manifest(manifest)
+            return artifact
+
+    def put(self, key, env, actions, values, spec=None):
+        """
+        Stores a solve result under key and returns it as a storage.PolicyArtifact.
+        """
+        filename = self.path(key)
+        tmp = filename + '.{}.tmp'.format(os.getpid())
+        storage.save_artifact(tmp, env, actions, values)
+        entry = {'size': os.path.getsize(tmp), 'sha256': _file_digest(tmp), 'created': time.time(),
+                 'last_used': time.time(), 'spec': spec}
+
+        with self._locked():
+            os.replace(tmp, filename)
+            manifest = self._read_manifest()
+            manifest[key] = entry
+            self._evict(manifest, keep=key)
+            self._write_manifest(manifest)
+        return storage.PolicyArtifact(filename)
+
+    def _evict(self, manifest, keep=None):
+        total = sum(entry['size'] for entry in manifest.values())
+        for key in sorted(manifest, key=lambda k: manifest[k]['last_used']):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            total -= manifest[key]['size']
+            self._remove(manifest, key)
+
+    def entries(self):
+        """
+        A snapshot of the manifest, {key: {'size', 'sha256', 'created', 'last_used', 'spec'}}.
+        """
+        with self._locked():
+            return self._read_manifest()
+
+    def size(self):
+        return sum(entry['size'] for entry in self._read_manifest().values())
+
+    def clear(self):
+        with self._locked():
+            manifest = self._read_manifest()
+            for key in list(manifest):
+                self._remove(manifest, key)
+            self._write_manifest(manifest)
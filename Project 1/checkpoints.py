@@ -0,0 +1,88 @@
+import os
+import multiprocessing
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+# All plotting.value_planes needs from the env, cheap to send to the render process
+Grid = namedtuple('Grid', ['x_bounds', 'y_bounds'])
+
+def checkpoint_titles(name, start, n, total, every=None):
+    """
+    Titles of the checkpoints in iterations/episodes [start, start + n) of a run of total:
+    the initial one (1) and the half-way one (total // 2) as before, plus every multiple of every.
+    """
+    titles = []
+    if(start <= 1 < start + n):
+        titles.append("Initial {}".format(name))
+    if(start <= total//2 < start + n):
+        titles.append("Half-way {}".format(name))
+    if every:
+        first = -(-max(start, 1) // every) * every
+        titles += ["{} at {}".format(name, i) for i in range(first, start + n, every)]
+    return titles
+
+def _render(values, grid, title, folder):
+    # Runs in the render process, saving never touches pyplot or a GUI backend
+    import plotting
+    os.makedirs(folder, exist_ok=True)
+    plotting.plot_value_function(values, title, 1, grid, folder)
+    return title
+
+class CheckpointPlotter:
+    """
+    Renders checkpoint plots in a background process while training goes on.
+    
+    submit copies the value array and returns at once, worker processes (one by default) draw the
+    PNGs into results_plots. At most max_pending snapshots are queued, further
+    checkpoints are skipped (with a message) until the renderer catches up, so memory stays bounded.
+    Attach it with solver.plotter = plotter, and call close() (or use it as a context manager) to wait
+    for the last plots.
+    """
+    def __init__(self, env, folder='./results_plots', max_pending=16, workers=1):
+        self.grid = Grid(tuple(env.x_bounds), tuple(env.y_bounds))
+        self.folder = os.path.abspath(folder)
+        self.max_pending = max_pending
+        self.workers = workers
+        self.pool = None
+        self.pending = []
+        self.skipped = 0
+
+    def submit(self, values, title):
+        self.pending = [f for f in self.pending if not f.done() or self._check(f)]
+        if len(self.pending) >= self.max_pending:
+            print("Renderer busy, skipping checkpoint:", title)
+            self.skipped += 1
+            return None
+        
+        if self.pool is None:
+            # fork keeps the solver's __main__ from being re-run in the render process
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context('fork' if 'fork' in methods else 'spawn')
+            self.pool = ProcessPoolExecutor(self.workers, mp_context=context)
+        
+        # Snapshot now, training keeps updating the array while the job waits to be pickled
+        future = self.pool.submit(_render, values.copy(), self.grid, title, self.folder)
+        self.pending.append(future)
+        return future
+
+    def _check(self, future):
+        # Surfaces render errors of finished jobs, always drops them from pending
+        future.result()
+        return False
+
+    def wait(self):
+        for future in self.pending:
+            future.result()
+        self.pending = []
+
+    def close(self):
+        if self.pool is not None:
+            self.wait()
+            self.pool.shutdown()
+            self.pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -1,269 +1,416 @@
-import numpy as np
-import matplotlib.pyplot as plt
-import random
-import time
+import argparse
+import contextlib
+import io
 import json
+import time
 import os
+import sys
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
 
 from CarEnv import CarEnv
-from PI import PolicyIteration
+from PI import VectorizedPolicyIteration, greedy_backup
+from VI import ValueIteration
 from MC import MonteCarloLearning
 from MCC import MonteCarloControl
-import plotting
-
-def serialize_policy(policy):
-    # Convert dictionary keys to strings
-    return {str(k): v for k, v in policy.items()}
-
-def save_policy(policy, filename):
-    with open(filename, 'w') as f:
-        json.dump(serialize_policy(policy), f, indent=4)
+import rollout
+from cache import SolveCache, solve_key
+from warmstart import transfer, nearest_cached
+from checkpoints import CheckpointPlotter
+
+ALGORITHMS = ['pi', 'mcc', 'vi']
+# Solvers that converge to the same fixed point whatever they start from, a warm start only makes them faster
+CONVERGENT = ['pi', 'vi']
+
+def solver_params(algorithm, episodes=100000, gamma=0.9):
+    # Everything that changes what solve returns, part of the cache key
+    params = {'gamma': gamma, 'theta': 1e-3}
+    if algorithm == 'mcc':
+        params = {'gamma': gamma, 'epsilon': 0.1, 'episodes': episodes, 'batch_size': 10000}
+    return params
+
+def solve(env, algorithm, episodes=100000, gamma=0.9, warm=None):
+    """
+    Runs one solver on env's target and returns (actions, values) arrays over the state indices.
+    warm is an optional (values, actions) seed from warmstart.transfer.
+    """
+    if algorithm == 'pi':
+        pi = VectorizedPolicyIteration(env, gamma)
+        if warm is not None:
+            pi.warm_start(*warm)
+        pi.run_until_converged()
+        return pi.pi, pi.V
+    if algorithm == 'vi':
+        vi = ValueIteration(env, gamma, in_place=True, sweep_order='backward')
+        if warm is not None:
+            vi.warm_start(warm[0])
+        vi.run_value_iteration()
+        return greedy_backup(vi.model, vi.V, gamma)[1], vi.V
+    if algorithm == 'mcc':
+        mcc = MonteCarloControl(env, gamma)
+        if warm is not None:
+            mcc.warm_start(warm[0])
+        mcc.run_monte_carlo(episodes, batch_size=10000)
+        return mcc.Q.argmax(axis=1), mcc.Q.max(axis=1)
+    raise ValueError("Unknown algorithm: {}".format(algorithm))
+
+def run_job(job):
+    """
+    Solves (or loads from the cache) every algorithm of a job on a headless env and runs the test starts.
+    
+    job is a dict with target [x, y, orientation], starts (list of [x, y, orientation] or 'all'),
+    grid, algorithms, episodes, gamma, cache_dir, cache_size (bytes) and warm_start (seed the solvers from
+    the nearest cached solve of the same algorithm, an MCC solve is then cached under the seed as well).
+    Returns a JSON ready result dict, a start outside the grid raises ValueError.
+    """
+    target = tuple(job['target'])
+    env = CarEnv(job['grid'], job['grid'], (0, 0), 'N', (target[0], target[1]), target[2], headless=True)
+    starts = None if job['starts'] == 'all' else [tuple(s) for s in job['starts']]
+    # Check the starts before solving, a start off the grid has no state to test from
+    for start in starts or []:
+        if not env.in_bounds(start[0], start[1]) or start[2] not in env.directions:
+            raise ValueError("Start {} is outside the grid {} of target {}".format(start, job['grid'], target))
+    cache = SolveCache(job['cache_dir'], job['cache_size'])
+    result = {'target': list(target), 'grid': job['grid'], 'algorithms': {}}
+    
+    for algorithm in job['algorithms']:
+        params = solver_params(algorithm, job['episodes'], job['gamma'])
+        key, spec = solve_key(env, algorithm, **params)
+        artifact = cache.get(key)
+        source = None
+        if artifact is None and job.get('warm_start'):
+            source = nearest_cached(cache, env, algorithm)
+            if source is not None and algorithm not in CONVERGENT:
+                # MCC ends up elsewhere depending on its seed, key the warm solve by the seed so a
+                # cold run is never served it
+                params['warm_start'] = os.path.splitext(os.path.basename(source.filename))[0]
+                key, spec = solve_key(env, algorithm, **params)
+                artifact = cache.get(key)
+        entry = {'artifact': cache.path(key), 'cached': artifact is not None, 'solve_time': 0.0}
+        if artifact is None:
+            start_time = time.time()
+            warm = transfer(source, env) if source is not None else None
+            entry['warm_start'] = source.filename if source is not None else None
+            # The solvers report progress with print, keep the job output clean
+            with contextlib.redirect_stdout(io.StringIO()):
+                actions, values = solve(env, algorithm, job['episodes'], job['gamma'], warm)
+            entry['solve_time'] = time.time() - start_time
+            artifact = cache.put(key, env, actions, values, spec)
         
-def deserialize_policy(policy):
-    # Convert dictionary keys back to original type if needed
-    # For now, assuming keys are strings that need to be tuples
-    return {eval(k): v for k, v in policy.items()}
+        runs = rollout.rollout_policy(env, artifact, starts)
+        if starts is None:
+            entry['summary'] = rollout.summary(runs)
+        else:
+            # Steps to the target like the interactive tests, 'INF' when it is not reached
+            entry['tests'] = [{'start': list(start), 'steps': int(length) if status == rollout.SUCCESS else 'INF',
+                               'status': rollout.STATUS_NAMES[status]}
+                              for start, length, status in zip(starts, runs['lengths'].tolist(), runs['status'].tolist())]
+        result['algorithms'][algorithm] = entry
+    return result
+
+def parse_state(values):
+    x, y, orientation = values
+    return [int(x), int(y), orientation]
+
+def load_jobs(filename, defaults):
+    """
+    Reads a JSON job file: a list of jobs or {"defaults": {...}, "jobs": [...]}.
+    Keys missing from a job come from the file defaults, then from the command line.
+    """
+    with open(filename) as f:
+        spec = json.load(f)
+    if isinstance(spec, list):
+        spec = {'jobs': spec}
+    defaults = dict(defaults, **spec.get('defaults', {}))
+    return [dict(defaults, **job) for job in spec['jobs']]
+
+def print_table(results):
+    print(f"{'Target':<20}{'Algorithm':<11}{'Cached':<8}{'Solve (s)':<11}{'Start':<20}{'Steps'}")
+    for result in results:
+        for algorithm, entry in result['algorithms'].items():
+            cached = 'yes' if entry['cached'] else 'no'
+            rows = entry.get('tests') or [{'start': 'all', 'steps': entry.get('summary')}]
+            for row in rows:
+                print(f"{str(tuple(result['target'])):<20}{algorithm:<11}{cached:<8}{entry['solve_time']:<11.3f}{str(tuple(row['start'])) if row['start'] != 'all' else 'all':<20}{row['steps']}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Solves car parking targets headless and tests the policies. "
+                                                 "Without arguments it runs the interactive version.")
+    # Separate values so negative coordinates parse, e.g. --start -5 -5 S
+    parser.add_argument('--target', action='append', nargs=3, default=[], metavar=('X', 'Y', 'O'), help="repeat for more targets")
+    parser.add_argument('--start', action='append', nargs=3, metavar=('X', 'Y', 'O'), help="repeat for more starts, default 0 0 N")
+    parser.add_argument('--all-starts', action='store_true', help="test from every state")
+    parser.add_argument('--jobs', help="JSON job file")
+    parser.add_argument('--grid', type=int, default=50)
+    parser.add_argument('--algorithms', nargs='+', default=['pi', 'mcc'], choices=ALGORITHMS)
+    parser.add_argument('--episodes', type=int, default=100000, help="MCC episodes")
+    parser.add_argument('--gamma', type=float, default=0.9)
+    parser.add_argument('--cache-dir', default='./cache', help="solve cache directory")
+    parser.add_argument('--cache-size', type=int, default=1024, help="solve cache size limit in MB")
+    parser.add_argument('--warm-start', action='store_true', help="seed solves from the nearest cached solution")
+    parser.add_argument('--workers', type=int, default=1, help="jobs solved in parallel")
+    parser.add_argument('--json', action='store_true', help="print the results as JSON")
+    args = parser.parse_args()
+    
+    try:
+        targets = [parse_state(t) for t in args.target]
+        starts = 'all' if args.all_starts else [parse_state(s) for s in args.start or [('0', '0', 'N')]]
+    except ValueError:
+        parser.error("positions are X Y O with integer X and Y")
+    defaults = {'starts': starts, 'grid': args.grid, 'algorithms': args.algorithms, 'episodes': args.episodes,
+                'gamma': args.gamma, 'cache_dir': args.cache_dir, 'cache_size': args.cache_size << 20,
+                'warm_start': args.warm_start}
+    jobs = [dict(defaults, target=target) for target in targets]
+    if args.jobs:
+        jobs += load_jobs(args.jobs, defaults)
+    if not jobs:
+        parser.error("no targets, use --target or --jobs")
+    
+    if args.workers > 1:
+        with ProcessPoolExecutor(args.workers) as pool:
+            results = list(pool.map(run_job, jobs))
+    else:
+        results = [run_job(job) for job in jobs]
+    
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_table(results)
 
-print("Enter target position (x, y): ", end= "")
-x, y = list(map(int, input().split()))
+def interactive():
+    """
+    The original prompt driven run: one target, PI and MCC, rendered test runs and plots.
+    """
+    import plotting
+    
+    print("Enter target position (x, y): ", end= "")
+    x, y = list(map(int, input().split()))
 
-target_position = (x, y)
+    target_position = (x, y)
 
-print("Enter target orientation (N, NE, E, SE, S, SW, W, NW): ", end= "")
-target_orientation = input()
+    print("Enter target orientation (N, NE, E, SE, S, SW, W, NW): ", end= "")
+    target_orientation = input()
 
-# Test the policy
-number_of_tests = int(input("Enter number of tests: "))
-tests = []
+    # Test the policy
+    number_of_tests = int(input("Enter number of tests: "))
+    tests = []
 
-for i in range(number_of_tests):
-    x, y = list(map(int, input("Enter start position (x, y): ").split()))
-    start_orientation = input("Enter start orientation (N, NE, E, SE, S, SW, W, NW): ")
+    for i in range(number_of_tests):
+        x, y = list(map(int, input("Enter start position (x, y): ").split()))
+        start_orientation = input("Enter start orientation (N, NE, E, SE, S, SW, W, NW): ")
     
-    tests.append((x, y, start_orientation))
+        tests.append((x, y, start_orientation))
 
-start_position = (0, 0)
-start_orientation = 'N'
+    start_position = (0, 0)
+    start_orientation = 'N'
 
-grid = 50
+    grid = 50
 
-env = CarEnv(grid, grid, start_position, start_orientation, target_position, target_orientation)
+    env = CarEnv(grid, grid, start_position, start_orientation, target_position, target_orientation)
 
-target = (target_position[0], target_position[1], target_orientation)
+    target = (target_position[0], target_position[1], target_orientation)
 
-policy_target_name = 'PI_policy_(' + str(target_position[0]) + ', ' + str(target_position[1]) + ', ' + str(target_orientation) + ').json'
-values_target_name = 'PI_values_(' + str(target_position[0]) + ', ' + str(target_position[1]) + ', ' + str(target_orientation) + ').json'
+    # Checkpoint plots are rendered in the background while training continues
+    plotter = CheckpointPlotter(env)
 
-# Policy Iteration
-pi = PolicyIteration(env)
+    # Solver results are cached by a hash of the env and solver configuration
+    cache = SolveCache()
 
-try:
-    with open(policy_target_name, 'r') as f:
-        policy = json.load(f)
-        pi_policy = deserialize_policy(policy)
-        
-    print("\nPolicy loaded from file: ", policy_target_name)
-    
-    with open(values_target_name, 'r') as f:
-        values = json.load(f)
-        pi_values = deserialize_policy(values)
-        
-    print("\nValues loaded from file: ", values_target_name)
-except:
-    start_time = time.time()
-    pi.run_policy_iteration(100)
-    end_time = time.time()
-    
-    print("\nTime taken for Policy Iteration: ", end_time - start_time)
-    
-    pi_policy = pi.get_policy()
+    # Policy Iteration
+    pi = VectorizedPolicyIteration(env)
+    pi.plotter = plotter
+    pi_key, pi_spec = solve_key(env, 'pi', gamma=pi.gamma, iterations=100)
 
-    save_policy(pi_policy, policy_target_name)
+    pi_policy = cache.get(pi_key)
+    if pi_policy is not None:
+        pi_values = pi_policy.get_value_table()
+        
+        print("\nPolicy and values loaded from cache: ", cache.path(pi_key))
+    else:
+        start_time = time.time()
+        pi.run_policy_iteration(100)
+        end_time = time.time()
     
-    print("\nPolicy saved to file: ", policy_target_name)
+        print("\nTime taken for Policy Iteration: ", end_time - start_time)
     
-    pi_values = pi.get_value_table()
+        pi_policy = pi.get_policy()
+        pi_values = pi.get_value_table()
     
-    save_policy(pi_values, values_target_name)
+        cache.put(pi_key, env, pi.pi, pi.V, pi_spec)
     
-    print("\nValues saved to file: ", values_target_name)
+        print("\nPolicy and values saved to cache: ", cache.path(pi_key))
 
-# print("Policy Iteration Policy: ", pi_policy)
+    # print("Policy Iteration Policy: ", pi_policy)
 
-print()
+    print()
 
-results = []
+    results = []
 
-for i in range(number_of_tests):
-    env.reset()
+    for i in range(number_of_tests):
+        env.reset()
     
-    state = tests[i]
+        state = tests[i]
     
-    if(state == target):
-        print("\nTarget already reached!\n")
-        print()
-        continue
+        if(state == target):
+            print("\nTarget already reached!\n")
+            print()
+            continue
     
-    env.orientation = state[2]
-    env.x = state[0]
-    env.y = state[1]
+        env.orientation = state[2]
+        env.x = state[0]
+        env.y = state[1]
     
-    print("Start position: ", state)
+        print("Start position: ", state)
     
-    vis = {state}
+        vis = {state}
     
-    done = False
-    ct = 0
-    while not done:
-        action = pi_policy[state]
+        done = False
+        ct = 0
+        while not done:
+            action = pi_policy[state]
         
-        if(action is None):
-            print("No valid action found!")
-            ct = 'INF'
-            break
+            if(action is None):
+                print("No valid action found!")
+                ct = 'INF'
+                break
         
-        _, _, done = env.step(*action, True)
-        state = (env.x, env.y, env.orientation)
+            _, _, done = env.step(*action, True)
+            state = (env.x, env.y, env.orientation)
         
-        if(state in vis):
-            print("Stuck in loop!")
-            ct = 'INF'
-            break
-        vis.add(state)
-        ct += 1
+            if(state in vis):
+                print("Stuck in loop!")
+                ct = 'INF'
+                break
+            vis.add(state)
+            ct += 1
         
-    env.render()
+        env.render()
     
-    if(ct != 'INF'):
-        print("\nTarget Reached in ", ct, " steps!\n")
-    else:
-        print("\nTarget not reached!\n")
+        if(ct != 'INF'):
+            print("\nTarget Reached in ", ct, " steps!\n")
+        else:
+            print("\nTarget not reached!\n")
         
-    results.append([ct, -1])
+        results.append([ct, -1])
 
 
-env.off_interactive()
+    env.off_interactive()
 
-print('\nPlotting Values of PI:')
-plotting.plot_value_function(pi_values, 'Final Value Tablue of PI', save = 0)
+    print('\nPlotting Values of PI:')
+    plotting.plot_value_function(pi_values, 'Final Value Tablue of PI', save = 0)
 
-env.on_interactive()
+    env.on_interactive()
 
-#######################################################################
+    #######################################################################
 
-# Monte Carlo
-# mc = MonteCarloLearning(env)
-# policy_target_name = 'MC_policy_(' + str(target_position[0]) + ', ' + str(target_position[1]) + ', ' + str(target_orientation) + ').json'
+    # Monte Carlo
+    # mc = MonteCarloLearning(env)
+    # policy_target_name = 'MC_policy_(' + str(target_position[0]) + ', ' + str(target_position[1]) + ', ' + str(target_orientation) + ').json'
 
-mcc = MonteCarloControl(env)
-policy_target_name = 'MCC_policy_(' + str(target_position[0]) + ', ' + str(target_position[1]) + ', ' + str(target_orientation) + ').json'
-q_values_target_name = 'MCC_q_values_(' + str(target_position[0]) + ', ' + str(target_position[1]) + ', ' + str(target_orientation) + ').json'
+    mcc = MonteCarloControl(env)
+    mcc.plotter = plotter
+    mcc_key, mcc_spec = solve_key(env, 'mcc', gamma=mcc.gamma, epsilon=mcc.epsilon, episodes=100000)
 
-try:
-    with open(policy_target_name, 'r') as f:
-        policy = json.load(f)
-        # mc_policy = deserialize_policy(policy)
-        mcc_policy = deserialize_policy(policy)
+    mcc_policy = cache.get(mcc_key)
+    if mcc_policy is not None:
+        mcc_q_values = mcc_policy.get_value_table()
         
-    print("\nPolicy loaded from file: ", policy_target_name)
-    
-    with open(q_values_target_name, 'r') as f:
-        q_values = json.load(f)
-        mcc_q_values = deserialize_policy(q_values)
-        
-    print("\nQ-Values loaded from file: ", q_values_target_name)
-except:
-    start_time = time.time()
-    # mc.run_monte_carlo(200)
-    mcc.run_monte_carlo(100000)
-    end_time = time.time()
-    
-    print("\nTime taken for Monte Carlo Learning: ", end_time - start_time)
-    
-    # mc_policy = mc.get_policy()
-    mcc_policy = mcc.get_policy()
-    mcc_q_values = mcc.get_q_values()
+        print("\nPolicy and Q-Values loaded from cache: ", cache.path(mcc_key))
+    else:
+        start_time = time.time()
+        # mc.run_monte_carlo(200)
+        mcc.run_monte_carlo(100000)
+        end_time = time.time()
     
-    all_states = [(x, y, orientation) for x in range(-5, 6) for y in range(-5, 6) for orientation in env.directions]
+        print("\nTime taken for Monte Carlo Learning: ", end_time - start_time)
     
-    # mcc.print_q_values(all_states) # To print Q-values for all states
+        # mc_policy = mc.get_policy()
+        mcc_policy = mcc.get_policy()
+        mcc_q_values = mcc.get_q_values()
     
-    # save_policy(mc_policy, policy_target_name)
-    save_policy(mcc_policy, policy_target_name)
+        all_states = [(x, y, orientation) for x in range(-5, 6) for y in range(-5, 6) for orientation in env.directions]
     
-    print("\nPolicy saved to file: ", policy_target_name)
+        # mcc.print_q_values(all_states) # To print Q-values for all states
     
-    save_policy(mcc_q_values, q_values_target_name)
+        cache.put(mcc_key, env, mcc.Q.argmax(axis=1), mcc.Q.max(axis=1), mcc_spec)
     
-    print("\nQ-Values saved to file: ", q_values_target_name)
+        print("\nPolicy and Q-Values saved to cache: ", cache.path(mcc_key))
 
-# print("Policy Iteration Policy: ", mc_policy)
+    # print("Policy Iteration Policy: ", mc_policy)
 
-print()
+    print()
 
-for i in range(number_of_tests):
-    env.reset()
+    for i in range(number_of_tests):
+        env.reset()
     
-    state = tests[i]
+        state = tests[i]
     
-    if(state == target):
-        print("\nTarget already reached!\n")
-        print()
-        continue
+        if(state == target):
+            print("\nTarget already reached!\n")
+            print()
+            continue
     
-    env.orientation = state[2]
-    env.x = state[0]
-    env.y = state[1]
+        env.orientation = state[2]
+        env.x = state[0]
+        env.y = state[1]
     
-    print("Start position: ", (x, y, start_orientation))
+        print("Start position: ", (x, y, start_orientation))
     
-    vis = {state}
+        vis = {state}
     
-    done = False
-    ct = 0
-    while not done:
-        # action = mc_policy[state]
-        action = mcc_policy[state]
+        done = False
+        ct = 0
+        while not done:
+            # action = mc_policy[state]
+            action = mcc_policy[state]
         
-        if(action is None):
-            print("No valid action found!")
-            ct = 'INF'
-            break
+            if(action is None):
+                print("No valid action found!")
+                ct = 'INF'
+                break
         
-        _, _, done = env.step(*action, True)
-        state = (env.x, env.y, env.orientation)
+            _, _, done = env.step(*action, True)
+            state = (env.x, env.y, env.orientation)
         
-        if state[0] < -grid or state[0] > grid or state[1] < -grid or state[1] > grid:
-            ct = 'INF'
-            break
+            if state[0] < -grid or state[0] > grid or state[1] < -grid or state[1] > grid:
+                ct = 'INF'
+                break
         
-        if(state in vis):
-            print("Stuck in loop!")
-            ct = 'INF'
-            break
-        vis.add(state)
-        ct += 1
+            if(state in vis):
+                print("Stuck in loop!")
+                ct = 'INF'
+                break
+            vis.add(state)
+            ct += 1
         
-    env.render()
+        env.render()
     
-    if(ct != 'INF'):
-        print("\nTarget Reached in ", ct, " steps!\n")
-    else:
-        print("\nTarget not reached!\n")
+        if(ct != 'INF'):
+            print("\nTarget Reached in ", ct, " steps!\n")
+        else:
+            print("\nTarget not reached!\n")
         
-    results[i][1] = ct
+        results[i][1] = ct
     
-print("\nResults - Target:", target)
-print(f"{'Start Position':<25}{'Policy Iteration':<25}{'Monte Carlo'}")
+    print("\nResults - Target:", target)
+    print(f"{'Start Position':<25}{'Policy Iteration':<25}{'Monte Carlo'}")
 
-for i in range(number_of_tests):
-    print(f"{str(tests[i]):<25}{str(results[i][0]):<25}{str(results[i][1])}")
+    for i in range(number_of_tests):
+        print(f"{str(tests[i]):<25}{str(results[i][0]):<25}{str(results[i][1])}")
 
-env.off_interactive()
+    env.off_interactive()
 
-print('\nPlotting Q-Values of MCC:')
-plotting.plot_value_function(mcc_q_values, 'Final Q-Values of MCC', save = 0)
+    print('\nPlotting Q-Values of MCC:')
+    plotting.plot_value_function(mcc_q_values, 'Final Q-Values of MCC', save = 0)
 
-env.on_interactive()
+    env.on_interactive()
 
-env.reset()
\ No newline at end of file
+    env.reset()
+
+    plotter.close()
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        main()
+    else:
+        interactive()
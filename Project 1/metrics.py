@@ -0,0 +1,154 @@
+import time
+from contextlib import contextmanager
+
+class _Phase:
+    __slots__ = ('metrics', 'name', 'start')
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.add_time(self.name, time.perf_counter() - self.start)
+        return False
+
+class _NullPhase:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+class Metrics:
+    """
+    Per-phase timers and counters for the learning loops.
+
+    Attach it with solver.metrics = Metrics(), the solvers then time their phases with
+    `with metrics.phase(name)` and count steps, episodes, episode endings and backups.
+    Phases can nest, a nested phase is also counted in the time of the enclosing one.
+    """
+    enabled = True
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.times = {}
+        self.calls = {}
+        self.counters = {}
+        self.started = time.perf_counter()
+
+    def phase(self, name):
+        return _Phase(self, name)
+
+    def add_time(self, name, seconds):
+        self.times[name] = self.times.get(name, 0.0) + seconds
+        self.calls[name] = self.calls.get(name, 0) + 1
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def report(self):
+        elapsed = self.elapsed()
+        return {
+            'elapsed': elapsed,
+            'phases': {name: {'calls': self.calls[name], 'seconds': seconds} for name, seconds in self.times.items()},
+            'counters': dict(self.counters),
+            'rates': {name + '_per_sec': n / elapsed for name, n in self.counters.items()},
+        }
+
+    def print_report(self):
+        elapsed = self.elapsed()
+        print(f"\n{'Phase':<25}{'Calls':<12}{'Total (s)':<14}{'Mean (ms)':<14}{'% of time'}")
+        for name, seconds in sorted(self.times.items(), key=lambda item: -item[1]):
+            calls = self.calls[name]
+            print(f"{name:<25}{calls:<12}{seconds:<14.3f}{1000 * seconds / calls:<14.4f}{100 * seconds / elapsed:.1f}")
+
+        print(f"\n{'Counter':<25}{'Count':<14}{'Per second'}")
+        for name, n in sorted(self.counters.items()):
+            print(f"{name:<25}{n:<14}{n / elapsed:.1f}")
+        print("\nElapsed: ", elapsed)
+
+class NullMetrics:
+    """
+    The default, disabled metrics: every call is a no-op so the loops pay almost nothing.
+    Code that would have to compute a count first checks metrics.enabled.
+    """
+    enabled = False
+    _phase = _NullPhase()
+
+    def phase(self, name):
+        return self._phase
+
+    def add_time(self, name, seconds):
+        pass
+
+    def count(self, name, n=1):
+        pass
+
+    def report(self):
+        return {}
+
+    def print_report(self):
+        pass
+
+NULL_METRICS = NullMetrics()
+
+@contextmanager
+def profile(filename=None, tool='auto', sort='cumulative', limit=25):
+    """
+    Profiles the enclosed block with pyinstrument or cProfile.
+
+    tool='auto' uses pyinstrument when it is installed (optional dependency) and cProfile
+    otherwise, 'pyinstrument' or 'cprofile' pick one. With a filename the pyinstrument HTML report
+    or the cProfile stats (pstats format) are written there, otherwise the top limit entries are printed.
+    """
+    if tool == 'auto':
+        try:
+            import pyinstrument
+            tool = 'pyinstrument'
+        except ImportError:
+            tool = 'cprofile'
+
+    if tool == 'pyinstrument':
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            raise ImportError("profile(tool='pyinstrument') needs pyinstrument: pip install pyinstrument")
+        profiler = Profiler()
+        profiler.start()
+        try:
+            yield profiler
+        finally:
+            profiler.stop()
+            if filename:
+                with open(filename, 'w') as f:
+                    f.write(profiler.output_html())
+            else:
+                print(profiler.output_text())
+        return
+
+    if tool != 'cprofile':
+        raise ValueError("Unknown profiler: {}".format(tool))
+
+    import cProfile
+    import pstats
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
+        if filename:
+            profiler.dump_stats(filename)
+        else:
+            pstats.Stats(profiler).sort_stats(sort).print_stats(limit)
@@ -1,64 +1,75 @@
 import matplotlib
 import numpy as np
-import pandas as pd
-from collections import namedtuple
 from matplotlib import pyplot as plt
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 from mpl_toolkits.mplot3d import Axes3D
 import os
 
-def plot_value_function(V, title="Value Function", save = 0):
-    """
-    Plots the value function as a series of surface plots, one for each orientation.
+# List of possible orientations
+orientations = ['N', 'NE', 'E', 'SE', 'S', 'SW', 'W', 'NW']
+
+def value_planes(V, env=None):
     """
-    # Determine the range of x and y from the keys in V
-    min_x = min(k[0] for k in V.keys())
-    max_x = max(k[0] for k in V.keys())
-    min_y = min(k[1] for k in V.keys())
-    max_y = max(k[1] for k in V.keys())
+    Builds the Z grid of every orientation at once, returns (x_range, y_range, Z) with Z[o, y, x].
     
-    # List of possible orientations
-    orientations = ['N', 'NE', 'E', 'SE', 'S', 'SW', 'W', 'NW']
+    V is either a value array over CarEnv state indices (env needed for the bounds), reshaped
+    directly, or a {(x, y, orientation): value} dict, converted once (missing states are 0).
+    """
+    if isinstance(V, dict):
+        keys = list(V.keys())
+        xs = np.fromiter((k[0] for k in keys), dtype=np.int64, count=len(keys))
+        ys = np.fromiter((k[1] for k in keys), dtype=np.int64, count=len(keys))
+        os_ = np.fromiter((orientations.index(k[2]) for k in keys), dtype=np.int64, count=len(keys))
+        x_range = np.arange(xs.min(), xs.max() + 1)
+        y_range = np.arange(ys.min(), ys.max() + 1)
+        
+        Z = np.zeros((len(orientations), len(y_range), len(x_range)))
+        Z[os_, ys - y_range[0], xs - x_range[0]] = np.fromiter(V.values(), dtype=np.float64, count=len(keys))
+    else:
+        x_range = np.arange(env.x_bounds[0], env.x_bounds[1] + 1)
+        y_range = np.arange(env.y_bounds[0], env.y_bounds[1] + 1)
+        Z = np.asarray(V, dtype=np.float64).reshape(len(x_range), len(y_range), len(orientations)).transpose(2, 1, 0)
+    return x_range, y_range, Z
 
-    # Create the range for x and y
-    x_range = np.arange(min_x, max_x + 1)
-    y_range = np.arange(min_y, max_y + 1)
+def plot_value_function(V, title="Value Function", save = 0, env = None, folder_path = './results_plots'):
+    """
+    Plots the value function as one figure of surface plots, one subplot for each orientation.
+    
+    V is a value dict or a value array over env's states (see value_planes). With save the figure
+    is drawn on an off-screen Agg canvas and written to <folder_path>/<title>.png, otherwise it is shown,
+    either way it is closed afterwards.
+    """
+    x_range, y_range, Z = value_planes(V, env)
     X, Y = np.meshgrid(x_range, y_range)
     
-    folder_path = './results_plots'
-    file_name = 'value_function.png'
-
-    def plot_surface(X, Y, Z, title):
-        """
-        Helper function to plot a 3D surface.
-        """
-        fig = plt.figure(figsize=(10, 7))
-        ax = fig.add_subplot(111, projection='3d')
-        surf = ax.plot_surface(X, Y, Z, rstride=1, cstride=1, cmap=matplotlib.cm.coolwarm)
+    file_name = '{}.png'.format(title)
+    
+    if(save):
+        fig = Figure(figsize=(20, 9))
+        FigureCanvasAgg(fig)
+    else:
+        fig = plt.figure(figsize=(20, 9))
+    
+    # Shared colour scale so the orientations can be compared
+    norm = matplotlib.colors.Normalize(Z.min(), Z.max())
+    for o, orien in enumerate(orientations):
+        ax = fig.add_subplot(2, 4, o + 1, projection='3d')
+        surf = ax.plot_surface(X, Y, Z[o], cmap=matplotlib.cm.coolwarm, norm=norm)
         ax.set_xlabel('X Position')
         ax.set_ylabel('Y Position')
         ax.set_zlabel('Value')
-        ax.set_title(title)
+        ax.set_title("Orientation: {}".format(orien))
         ax.view_init(25, -135)  # Set a good viewing angle for 3D plot
-        fig.colorbar(surf)
-        
-        if(save):
-            plt.savefig(os.path.join(folder_path, file_name))
-        else:
-            plt.show()
-
-    # Plot the value function for each orientation
-    for orien in orientations:
-        Z = np.zeros_like(X, dtype=np.float64)
-
-        # Fill the Z array with the corresponding values from V
-        for i in range(X.shape[0]):
-            for j in range(X.shape[1]):
-                x_val = X[i, j]
-                y_val = Y[i, j]
-                Z[i, j] = V.get((x_val, y_val, orien), 0)  # Use a default of 0 if key is not found
-
-        file_name = '{}_{}.png'.format(orien, title)
-        plot_surface(X, Y, Z, "{} (Orientation: {})".format(title, orien))
+    
+    fig.suptitle(title)
+    fig.colorbar(surf, ax=fig.axes, shrink=0.6)
+    
+    if(save):
+        fig.savefig(os.path.join(folder_path, file_name))
+    else:
+        plt.show()
+        plt.close(fig)
 
 # # Example usage
 # # Assuming you have a value function V that maps (x, y, orientation) to a float value
@@ -0,0 +1,83 @@
+import numpy as np
+
+from CarEnv import CarEnv
+from VI import ValueIteration
+
+class RelativeSolver:
+    """
+    Translation invariant planner for CarEnv.
+    
+    The dynamics only depend on the offset to the target and the orientation, so one value
+    table per target orientation is solved over relative coordinates on a padded grid that
+    covers every offset possible inside env's bounds. A query for any target then shifts the
+    lookup into that table and applies env's bounds mask to the candidate moves: a one step
+    lookahead instead of a fresh solve per target.
+    
+    Near the edges the relative table can count on paths that leave env's bounds, there the
+    masked greedy action is the best first move that stays inside but the path is not
+    guaranteed to be optimal for the bounded problem.
+    
+    Every query method raises ValueError for a target outside env's bounds.
+    """
+    def __init__(self, env, gamma=0.9, theta=1e-3):
+        self.env = env
+        self.gamma = gamma
+        self.theta = theta
+        self.rel_x = env.x_bounds[1] - env.x_bounds[0]
+        self.rel_y = env.y_bounds[1] - env.y_bounds[0]
+        self.rel_env = None
+        self.tables = {}
+
+    def solve(self, orientation):
+        """
+        Solves (and caches) the relative value table for target orientation.
+        """
+        if orientation not in self.tables:
+            if self.rel_env is None:
+                self.rel_env = CarEnv(self.rel_x, self.rel_y, (0, 0), orientation, (0, 0), orientation, headless=True)
+            vi = ValueIteration(self.rel_env, self.gamma, in_place=True, sweep_order='backward', target=(0, 0, orientation))
+            vi.run_value_iteration(self.theta, verbose=False)
+            self.tables[orientation] = vi.V
+        return self.tables[orientation]
+
+    def action_values(self, states, target):
+        """
+        Q values [len(states), nA] of env states for target, -inf for moves that leave env's bounds.
+        """
+        self.check_target(target)
+        V_rel = self.solve(target[2])
+        next_state, valid = self.env.get_dynamics()
+        next_state, valid = next_state[states], valid[states]
+        done = next_state == self.env.target_index(target)
+        reward = np.where(done, self.env.target_reward, -self.env.time_penalty)
+        
+        xs, ys, os = self.env.decode_states(next_state)
+        rel = self.rel_env.encode_states(xs - target[0], ys - target[1], os)
+        values = np.where(done, 0, V_rel[rel])
+        return np.where(valid, reward + self.gamma * values, -np.inf)
+
+    def check_target(self, target):
+        # Offsets of a target outside env's bounds fall outside the padded grid
+        if not self.env.in_bounds(target[0], target[1]):
+            raise ValueError("Target {} is outside the env bounds".format(tuple(target)))
+
+    def query(self, state, target):
+        """
+        Best (steering, velocity) from state towards target, None if no move stays in bounds.
+        """
+        q = self.action_values(np.array([self.env.state_index(state)]), target)[0]
+        if q.max() == -np.inf:
+            return None
+        return self.env.action_space[int(q.argmax())]
+
+    def get_policy(self, target):
+        q = self.action_values(np.arange(self.env.nS), target)
+        actions = q.argmax(axis=1)
+        actions[q.max(axis=1) == -np.inf] = -1
+        return self.env.decode_policy(actions)
+
+    def get_value_table(self, target):
+        self.check_target(target)
+        xs, ys, os = self.env.decode_states(np.arange(self.env.nS))
+        V_rel = self.solve(target[2])
+        return self.env.decode_values(V_rel[self.rel_env.encode_states(xs - target[0], ys - target[1], os)])
@@ -0,0 +1,141 @@
+import numpy as np
+
+SUCCESS = 0
+LOOP = 1
+OUT_OF_BOUNDS = 2
+NO_ACTION = 3
+STATUS_NAMES = ['success', 'loop', 'out of bounds', 'no action']
+
+def policy_actions(env, policy):
+    """
+    Any stored policy as indices into env.action_space (-1 for none): an index array,
+    a {state: (steering, velocity)} dict, or a storage.PolicyArtifact / stored policy.
+    """
+    if isinstance(policy, np.ndarray):
+        return policy.astype(np.int64)
+    if isinstance(policy, dict):
+        return env.encode_policy(policy)
+    return policy.action_indices(env)
+
+def rollout_policy(env, policy, starts=None, trajectories=False):
+    """
+    Runs a deterministic policy from many start states at once, without stepping or plotting the env.
+    
+    The policy turns the state space into a functional graph (every state has at most one successor),
+    so the outcome of all states is resolved together, walking backwards from the states where a
+    run ends. A run ends like the test loop in main.py: on the target (success), when the policy has
+    no action, when a move leaves the grid, or when a state repeats (loop). lengths counts the moves
+    made before that, the move that would leave the grid or repeat a state is not counted.
+    
+    starts are (x, y, orientation) tuples or state indices, None for every state. A start outside
+    the grid raises ValueError.
+    Returns a dict with 'starts', 'lengths' and 'status' arrays and, with trajectories=True,
+    'trajectories': visited state indices per start (start first), padded with -1.
+    """
+    model = env.get_transition_model()
+    actions = policy_actions(env, policy)
+    target = env.target_index()
+    states = np.arange(env.nS)
+    
+    has_action = actions >= 0
+    safe = np.where(has_action, actions, 0)
+    valid = has_action & model.valid[states, safe]
+    successor = np.where(valid, model.next_state[states, safe], -1)
+    
+    status = np.full(env.nS, -1, dtype=np.int64)
+    lengths = np.zeros(env.nS, dtype=np.int64)
+    status[~has_action] = NO_ACTION
+    status[has_action & ~valid] = OUT_OF_BOUNDS
+    if target >= 0:
+        status[target] = SUCCESS
+        successor[target] = -1
+    
+    # Resolve states whose successor is resolved until nothing changes, what is left runs into a cycle
+    pending = np.flatnonzero(status < 0)
+    while len(pending):
+        resolved = status[successor[pending]] >= 0
+        if not resolved.any():
+            break
+        ready = pending[resolved]
+        status[ready] = status[successor[ready]]
+        lengths[ready] = lengths[successor[ready]] + 1
+        pending = pending[~resolved]
+    
+    if len(pending):
+        status[pending] = LOOP
+        lengths[pending] = _loop_lengths(successor, pending)
+    
+    if starts is None:
+        starts = states
+    else:
+        starts = np.array([_start_index(env, s) for s in starts], dtype=np.int64)
+    
+    result = {'starts': starts, 'lengths': lengths[starts], 'status': status[starts]}
+    if trajectories:
+        result['trajectories'] = _trajectories(successor, starts, result['lengths'])
+    return result
+
+def _start_index(env, start):
+    # A start off the grid would index another state (negative wrap around) or past the tables
+    if np.isscalar(start):
+        if not 0 <= start < env.nS:
+            raise ValueError("Start state {} is outside [0, {})".format(start, env.nS))
+        return start
+    if not env.in_bounds(start[0], start[1]) or start[2] not in env.directions:
+        raise ValueError("Start {} is outside the env bounds".format(tuple(start)))
+    return env.state_index(start)
+
+def _loop_lengths(successor, loop_states):
+    """
+    Moves made before the first repeated state for states that end in a cycle: tail + cycle length - 1.
+    """
+    n = len(successor)
+    in_loop = np.zeros(n, dtype=bool)
+    in_loop[loop_states] = True
+    
+    # Peel off states nobody in the loop set points to, what remains are the cycles
+    indegree = np.bincount(successor[loop_states], minlength=n)
+    on_cycle = in_loop.copy()
+    leaves = loop_states[indegree[loop_states] == 0]
+    while len(leaves):
+        on_cycle[leaves] = False
+        np.subtract.at(indegree, successor[leaves], 1)
+        targets = successor[leaves]
+        leaves = np.unique(targets[on_cycle[targets] & (indegree[targets] == 0)])
+    
+    cycle_length = np.zeros(n, dtype=np.int64)
+    for s in np.flatnonzero(on_cycle).tolist():
+        if cycle_length[s]:
+            continue
+        cycle = [s]
+        while successor[cycle[-1]] != s:
+            cycle.append(successor[cycle[-1]])
+        cycle_length[cycle] = len(cycle)
+    
+    # Walk the tails backwards from the cycles
+    tail = np.where(on_cycle, 0, -1)
+    pending = loop_states[~on_cycle[loop_states]]
+    while len(pending):
+        ready = tail[successor[pending]] >= 0
+        tail[pending[ready]] = tail[successor[pending[ready]]] + 1
+        cycle_length[pending[ready]] = cycle_length[successor[pending[ready]]]
+        pending = pending[~ready]
+    
+    return tail[loop_states] + cycle_length[loop_states] - 1
+
+def _trajectories(successor, starts, lengths):
+    out = np.full((len(starts), lengths.max() + 1 if len(starts) else 1), -1, dtype=np.int32)
+    current = starts.copy()
+    out[:, 0] = current
+    for t in range(1, out.shape[1]):
+        moving = t <= lengths
+        current = np.where(moving, successor[current], current)
+        out[moving, t] = current[moving]
+    return out
+
+def summary(result):
+    """
+    Number of starts per status name.
+    """
+    counts = np.bincount(result['status'], minlength=len(STATUS_NAMES))
+    return {name: int(c) for name, c in zip(STATUS_NAMES, counts)}
@@ -0,0 +1,217 @@
+import ast
+import json
+import struct
+import numpy as np
+
+MAGIC = b'CARPOL01'
+STORE_MAGIC = b'CARSTO01'
+ALIGN = 64
+
+def _align(n):
+    return (n + ALIGN - 1) // ALIGN * ALIGN
+
+def _pack_actions(env, actions):
+    """
+    Splits env.action_space indices (-1 for none) into int8 steering and uint8 velocity arrays.
+    """
+    actions = np.asarray(actions)
+    has_action = actions >= 0
+    steering_ids = {a: i for i, a in enumerate(env.actions)}
+    steering = np.array([steering_ids[a] for a, _ in env.action_space], dtype=np.int8)
+    velocity = np.array([v for _, v in env.action_space], dtype=np.uint8)
+    safe = np.where(has_action, actions, 0)
+    return np.where(has_action, steering[safe], -1).astype(np.int8), np.where(has_action, velocity[safe], 0).astype(np.uint8)
+
+def _grid_header(env):
+    return {
+        'version': 1, 'x_limit': env.x_bounds[1], 'y_limit': env.y_bounds[1], 'directions': env.directions,
+        'actions': env.actions, 'velocities': env.velocities, 'n_states': env.nS, 'offsets': {}
+    }
+
+def _write(filename, magic, header, arrays):
+    # Offsets depend on the header length, so reserve room for them and fix them in a second pass
+    header_size = _align(len(magic) + 4 + len(json.dumps(header)) + 32 * len(arrays) + ALIGN)
+    offset = header_size
+    for name, array in arrays.items():
+        header['offsets'][name] = offset
+        offset = _align(offset + array.nbytes)
+    
+    raw = json.dumps(header).encode()
+    assert len(magic) + 4 + len(raw) <= header_size
+    with open(filename, 'wb') as f:
+        f.write(magic + struct.pack('<I', len(raw)) + raw)
+        for name, array in arrays.items():
+            f.seek(header['offsets'][name])
+            f.write(np.ascontiguousarray(array).tobytes())
+
+def read_header(filename, magic=MAGIC):
+    with open(filename, 'rb') as f:
+        if f.read(len(magic)) != magic:
+            raise ValueError("{} is not a {} file".format(filename, magic.decode()))
+        # A truncated or garbled header is reported like a wrong magic, not as struct or JSON errors
+        raw = f.read(4)
+        if len(raw) != 4:
+            raise ValueError("{} has a truncated header".format(filename))
+        length, = struct.unpack('<I', raw)
+        raw = f.read(length)
+        if len(raw) != length:
+            raise ValueError("{} has a truncated header".format(filename))
+        try:
+            return json.loads(raw)
+        except ValueError:
+            raise ValueError("{} has a damaged header".format(filename))
+
+def save_artifact(filename, env, actions, values, target=None):
+    """
+    Writes a policy and value table in the compact binary artifact format.
+    
+    Layout: MAGIC, uint32 header length, JSON header (grid size, target, direction and action
+    lists, array offsets), then packed arrays over env's integer state encoding: int8 steering
+    index (-1 for no action), uint8 velocity (0 for no action) and float32 values.
+    actions are indices into env.action_space (-1 for none), e.g. from env.encode_policy.
+    """
+    if target is None:
+        target = (env.target_position[0], env.target_position[1], env.target_orientation)
+    steering, velocity = _pack_actions(env, actions)
+    header = _grid_header(env)
+    header['target'] = [target[0], target[1], target[2]]
+    _write(filename, MAGIC, header, {'steering': steering, 'velocity': velocity, 'values': np.asarray(values, dtype=np.float32)})
+
+def save_store(filename, env, targets, actions, values):
+    """
+    Packs the policies of many targets into one file, see PolicyStore.
+    actions[T, S] and values[T, S] are ordered like targets, e.g. from batch.solve_targets.
+    """
+    steering, velocity = _pack_actions(env, actions)
+    header = _grid_header(env)
+    header['targets'] = [[t[0], t[1], t[2]] for t in targets]
+    _write(filename, STORE_MAGIC, header, {'steering': steering, 'velocity': velocity, 'values': np.asarray(values, dtype=np.float32)})
+
+class _Grid:
+    def _load_grid(self, header):
+        self.header = header
+        self.x_limit, self.y_limit = header['x_limit'], header['y_limit']
+        self.directions = header['directions']
+        self.actions = header['actions']
+        self.ny = 2 * self.y_limit + 1
+        self.nS = header['n_states']
+
+    def _memmap(self, filename, shape):
+        offsets = self.header['offsets']
+        self.steering = np.memmap(filename, dtype=np.int8, mode='r', offset=offsets['steering'], shape=shape)
+        self.velocity = np.memmap(filename, dtype=np.uint8, mode='r', offset=offsets['velocity'], shape=shape)
+        self.values = np.memmap(filename, dtype=np.float32, mode='r', offset=offsets['values'], shape=shape)
+
+    def state_index(self, state):
+        x, y, orientation = state
+        if abs(x) > self.x_limit or abs(y) > self.y_limit:
+            return -1
+        return ((x + self.x_limit) * self.ny + (y + self.y_limit)) * len(self.directions) + self.directions.index(orientation)
+
+    def states(self):
+        return [(x, y, o) for x in range(-self.x_limit, self.x_limit + 1)
+                for y in range(-self.y_limit, self.y_limit + 1) for o in self.directions]
+
+    def _action(self, row, s):
+        if s < 0 or self.steering[row][s] < 0:
+            return None
+        return (self.actions[self.steering[row][s]], int(self.velocity[row][s]))
+
+    def _action_indices(self, env, row):
+        velocity_ids = np.zeros(256, dtype=np.int64)
+        velocity_ids[env.velocities] = np.arange(len(env.velocities))
+        steering = np.asarray(self.steering[row])
+        ids = steering.astype(np.int64) * len(env.velocities) + velocity_ids[self.velocity[row]]
+        return np.where(steering >= 0, ids, -1)
+
+class PolicyArtifact(_Grid):
+    """
+    Read-only, memory-mapped view of a file written by save_artifact.
+    
+    artifact[(x, y, orientation)] gives (steering, velocity) or None like the policy dicts,
+    only the pages that are touched are read from disk.
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        self._load_grid(read_header(filename))
+        self.target = tuple(self.header['target'])
+        self._memmap(filename, (self.nS,))
+
+    def __getitem__(self, state):
+        return self._action(Ellipsis, self.state_index(state))
+
+    def value(self, state):
+        s = self.state_index(state)
+        return float(self.values[s]) if s >= 0 else 0.0
+
+    def action_indices(self, env):
+        """
+        Policy as indices into env.action_space (-1 for none), env must use the same grid.
+        """
+        return self._action_indices(env, Ellipsis)
+
+    def get_policy(self):
+        return {state: self[state] for state in self.states()}
+
+    def get_value_table(self):
+        return dict(zip(self.states(), self.values.tolist()))
+
+class PolicyStore(_Grid):
+    """
+    Memory-mapped store of many target policies written by save_store.
+    
+    The [target, state] arrays are only mapped, a lookup for (target, state) reads the pages it
+    touches, so RAM use follows the working set instead of the number of targets.
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        self._load_grid(read_header(filename, STORE_MAGIC))
+        self.targets = [tuple(t) for t in self.header['targets']]
+        self.index = {t: i for i, t in enumerate(self.targets)}
+        self._memmap(filename, (len(self.targets), self.nS))
+
+    def __contains__(self, target):
+        return tuple(target) in self.index
+
+    def __len__(self):
+        return len(self.targets)
+
+    def action(self, target, state):
+        return self._action(self.index[tuple(target)], self.state_index(state))
+
+    def value(self, target, state):
+        s = self.state_index(state)
+        return float(self.values[self.index[tuple(target)], s]) if s >= 0 else 0.0
+
+    def policy(self, target):
+        """
+        Policy of one target, behaves like a PolicyArtifact / policy dict for lookups.
+        """
+        return StoredPolicy(self, self.index[tuple(target)])
+
+class StoredPolicy:
+    def __init__(self, store, row):
+        self.store = store
+        self.row = row
+        self.target = store.targets[row]
+
+    def __getitem__(self, state):
+        return self.store._action(self.row, self.store.state_index(state))
+
+    def value(self, state):
+        s = self.store.state_index(state)
+        return float(self.store.values[self.row, s]) if s >= 0 else 0.0
+
+    def action_indices(self, env):
+        return self.store._action_indices(env, self.row)
+
+def convert_json(env, policy_file, values_file, filename):
+    """
+    Converts the old tuple-string JSON policy/value files of main.py to an artifact.
+    The keys are parsed as literals, a file with anything else in them raises ValueError.
+    """
+    with open(policy_file) as f:
+        policy = {ast.literal_eval(k): v for k, v in json.load(f).items()}
+    with open(values_file) as f:
+        values = {ast.literal_eval(k): v for k, v in json.load(f).items()}
+    save_artifact(filename, env, env.encode_policy(policy), env.encode_values(values))
@@ -0,0 +1,68 @@
+import numpy as np
+
+def transfer(artifact, env, shift=None):
+    """
+    Maps a solved artifact (storage.PolicyArtifact) onto env's states, returns (values, actions).
+
+    The car dynamics do not depend on the position, so the solution for a neighbouring target
+    carries over shifted by the target offset (shift defaults to env target - artifact target).
+    States the shifted source grid does not cover, e.g. when a smaller grid is extended to a larger
+    one, take the values and actions of the nearest source state on the same orientation.
+    A solution for another gamma maps one to one. The env target and states without a valid move
+    keep value 0 like in the solvers.
+    """
+    if list(artifact.directions) != list(env.directions):
+        raise ValueError("The artifact uses other directions than the env")
+    if shift is None:
+        shift = (env.target_position[0] - artifact.target[0], env.target_position[1] - artifact.target[1])
+
+    xs, ys, orientation_ids = env.decode_states(np.arange(env.nS))
+    sx = np.clip(xs - shift[0], -artifact.x_limit, artifact.x_limit)
+    sy = np.clip(ys - shift[1], -artifact.y_limit, artifact.y_limit)
+    source = ((sx + artifact.x_limit) * artifact.ny + (sy + artifact.y_limit)) * len(artifact.directions) + orientation_ids
+
+    values = np.asarray(artifact.values, dtype=np.float64)[source]
+    actions = artifact.action_indices(env)[source]
+    # States without a valid move are never backed up, keep them at 0 as in a cold start
+    values[~env.get_transition_model().valid.any(axis=1)] = 0
+    target = env.target_index()
+    if target >= 0:
+        values[target] = 0
+    return values, actions
+
+def q_from_values(env, values, gamma):
+    """
+    One-step lookahead Q[s, a] = reward + gamma * V[next] on env's transition model, the seed for
+    MonteCarloControl. Moves that leave the grid get the lowest seeded value so they are never greedy.
+    """
+    model = env.get_transition_model()
+    Q = model.reward + gamma * np.where(model.done, 0, values[model.next_state])
+    Q[~model.valid] = Q[model.valid].min() if model.valid.any() else 0
+    return Q
+
+def nearest_cached(cache, env, solver=None):
+    """
+    The cached solve (storage.PolicyArtifact) closest to env's query, None if nothing fits.
+
+    Candidates need the same dynamics, rewards and target orientation (and solver, when given), a
+    solution for another target orientation starts further from the answer than a cold start.
+    They are ranked by target distance, then by grid size difference.
+    """
+    from cache import solve_key
+    _, spec = solve_key(env, solver)
+    wanted = spec['env']
+    fixed = ['directions', 'actions', 'velocities', 'target_reward', 'time_penalty', 'target_orientation']
+
+    best = None
+    for key, entry in cache.entries().items():
+        other = (entry.get('spec') or {}).get('env')
+        if other is None or any(other[k] != wanted[k] for k in fixed):
+            continue
+        if solver is not None and entry['spec']['solver'] != solver:
+            continue
+        score = (abs(other['target_position'][0] - wanted['target_position'][0]) + abs(other['target_position'][1] - wanted['target_position'][1]),
+                 abs(other['x_limit'] - wanted['x_limit']) + abs(other['y_limit'] - wanted['y_limit']))
+        if best is None or score < best[0]:
+            best = (score, key)
+
+    return cache.get(best[1]) if best is not None else None
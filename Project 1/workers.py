@@ -0,0 +1,113 @@
+import os
+import numpy as np
+
+from CarEnv import CarEnv
+from metrics import NULL_METRICS
+
+def rollout_episodes(model, policy, starts, epsilon, rng, metrics=NULL_METRICS):
+    """
+    Runs len(starts) epsilon-greedy episodes at once on a CarEnv transition model.
+    
+    policy[state] is the greedy action index. Every step draws the exploration coins and random
+    actions for the whole batch in one call. Like MonteCarloControl.generate_episode an episode
+    ends on the target, and a move that leaves the grid or revisits a state ends it without being recorded.
+    Returns (states[n, T], actions[n, T], rewards[n, T], lengths[n]), only the first lengths[i] steps
+    of row i are meaningful. An enabled metrics object gets the simulated steps and how the episodes ended.
+    """
+    n = len(starts)
+    n_actions = model.next_state.shape[1]
+    capacity = 64
+    states = np.zeros((n, capacity), dtype=np.int64)
+    actions = np.zeros((n, capacity), dtype=np.int64)
+    rewards = np.zeros((n, capacity))
+    visited = np.full((n, capacity + 1), -1, dtype=np.int64)
+    lengths = np.zeros(n, dtype=np.int64)
+    
+    current = np.array(starts, dtype=np.int64)
+    visited[:, 0] = current
+    active = np.arange(n)
+    t = 0
+    while len(active):
+        if t == capacity:
+            states, actions, rewards = [np.concatenate([a, np.zeros_like(a)], axis=1) for a in (states, actions, rewards)]
+            visited = np.concatenate([visited, np.full((n, capacity), -1, dtype=np.int64)], axis=1)
+            capacity *= 2
+        
+        s = current[active]
+        explore = rng.random(len(active)) < epsilon
+        a = np.where(explore, rng.integers(n_actions, size=len(active)), policy[s])
+        next_s = model.next_state[s, a]
+        
+        # States without a policy action (-1) end the episode like MonteCarloLearning.generate_episode
+        has_action = policy[s] >= 0
+        valid = model.valid[s, a]
+        revisit = (visited[active, :t + 1] == next_s[:, None]).any(axis=1)
+        ok = has_action & valid & ~revisit
+        if metrics.enabled:
+            metrics.count('steps', len(active))
+            metrics.count('episodes_no_action', int((~has_action).sum()))
+            metrics.count('episodes_out_of_bounds', int((has_action & ~valid).sum()))
+            metrics.count('episodes_loop', int((has_action & valid & revisit).sum()))
+        recorded, s, a, next_s = active[ok], s[ok], a[ok], next_s[ok]
+        states[recorded, t] = s
+        actions[recorded, t] = a
+        rewards[recorded, t] = model.reward[s, a]
+        visited[recorded, t + 1] = next_s
+        lengths[recorded] += 1
+        current[recorded] = next_s
+        
+        active = recorded[~model.done[s, a]]
+        if metrics.enabled:
+            metrics.count('episodes_target', len(recorded) - len(active))
+        t += 1
+    
+    return states[:, :t], actions[:, :t], rewards[:, :t], lengths
+
+def episode_returns(rewards, lengths, gamma):
+    """
+    Discounted return G_t of every step of a batch from rollout_episodes.
+    """
+    G = np.zeros(len(lengths))
+    returns = np.zeros_like(rewards)
+    for t in range(rewards.shape[1] - 1, -1, -1):
+        G = np.where(t < lengths, rewards[:, t] + gamma * G, 0)
+        returns[:, t] = G
+    return returns
+
+def aggregate_returns(states, actions, rewards, lengths, gamma, n_actions):
+    """
+    Reduces a batch from rollout_episodes to (state_actions, return_sums, counts) with
+    state_action = state * n_actions + action. Episodes never revisit a state so every step is a first visit.
+    """
+    returns = episode_returns(rewards, lengths, gamma)
+    mask = np.arange(rewards.shape[1])[None, :] < lengths[:, None]
+    state_actions, inverse = np.unique(states[mask] * n_actions + actions[mask], return_inverse=True)
+    return state_actions, np.bincount(inverse, weights=returns[mask]), np.bincount(inverse)
+
+def round_sizes(remaining, batch_size, workers):
+    """
+    Episodes per worker for the next round of a parallel run: up to batch_size each, at most remaining in total.
+    """
+    sizes = [min(batch_size, remaining - i * batch_size) for i in range(workers)]
+    return [n for n in sizes if n > 0]
+
+# Per process state of the rollout workers, set up once by init_rollout_worker
+worker = {}
+
+def init_rollout_worker(config, seed):
+    """
+    Pool initializer: a headless CarEnv rebuilt from env.get_config() and a per process seeded generator.
+    """
+    env = CarEnv(**config, headless=True)
+    worker['env'] = env
+    worker['model'] = env.get_transition_model()
+    worker['rng'] = np.random.default_rng([seed, os.getpid()])
+
+def rollout_worker(policy, n, epsilon, gamma):
+    """
+    Plays n episodes from random starts and returns their (state_action, return_sum, count) aggregate.
+    """
+    env, rng = worker['env'], worker['rng']
+    starts = rng.integers(env.nS, size=n)
+    states, actions, rewards, lengths = rollout_episodes(worker['model'], policy, starts, epsilon, rng)
+    return aggregate_returns(states, actions, rewards, lengths, gamma, env.nA)